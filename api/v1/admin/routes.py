@@ -0,0 +1,15 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, status
+
+from api.v1.auth.dependency import CheckRole
+from db.slow_queries import get_slow_queries
+
+admin_router = APIRouter()
+admin_checker = CheckRole(['admin'])
+
+
+@admin_router.get('/slow-queries', status_code=status.HTTP_200_OK)
+async def get_slow_query_log(_: bool = Depends(admin_checker)) -> List[dict]:
+    """ Slow queries seen by this worker, with redacted parameters and a plan when one was sampled. """
+    return get_slow_queries()
@@ -0,0 +1,68 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from config import Config
+from .schema import Principal
+
+# Per-process cache of user uid -> (expires_at, principal). Other workers pick up role or
+# verification changes once their entry expires, so keep PRINCIPAL_CACHE_TTL short.
+_principals: dict[str, tuple[float, Principal]] = {}
+
+
+def get_cached_principal(user_uid: str) -> Optional[Principal]:
+    """ Returns the cached principal for a user, or None if it is missing or expired. """
+    entry = _principals.get(str(user_uid))
+    if entry is None:
+        return None
+
+    expires_at, principal = entry
+    if expires_at <= time.monotonic():
+        _principals.pop(str(user_uid), None)
+        return None
+
+    return principal
+
+
+def cache_principal(principal: Principal) -> None:
+    """ Caches a principal for PRINCIPAL_CACHE_TTL seconds, evicting the oldest entry when full. """
+    if len(_principals) >= Config.PRINCIPAL_CACHE_SIZE:
+        _principals.pop(next(iter(_principals)), None)  # dicts keep insertion order
+
+    _principals[str(principal.uid)] = (time.monotonic() + Config.PRINCIPAL_CACHE_TTL, principal)
+
+
+def invalidate_principal(user_uid) -> None:
+    """ Drops a user's cached principal so the next request reloads it from the database. """
+    _principals.pop(str(user_uid), None)
+
+
+# LRU of sha256(token) -> decoded claims for tokens whose signature has already been checked.
+# Entries are dropped once the token's exp passes, so an expired token is always re-verified and rejected.
+_verified_tokens: OrderedDict[bytes, dict] = OrderedDict()
+
+
+def get_verified_token(token: str) -> Optional[dict]:
+    """ Returns the claims of an already verified, unexpired token, or None if it must be verified again. """
+    key = hashlib.sha256(token.encode()).digest()
+    token_data = _verified_tokens.get(key)
+    if token_data is None:
+        return None
+
+    if token_data['exp'] <= time.time():
+        _verified_tokens.pop(key, None)
+        return None
+
+    _verified_tokens.move_to_end(key)
+    return token_data
+
+
+def cache_verified_token(token: str, token_data: dict) -> None:
+    """ Remembers the claims of a token that passed signature and expiry checks. """
+    key = hashlib.sha256(token.encode()).digest()
+    _verified_tokens[key] = token_data
+    _verified_tokens.move_to_end(key)
+
+    if len(_verified_tokens) > Config.VERIFIED_TOKEN_CACHE_SIZE:
+        _verified_tokens.popitem(last=False)
@@ -1,14 +1,107 @@
+from typing import Optional
+
+from celery.result import AsyncResult
+from celery.signals import worker_process_init, worker_process_shutdown
+
 from celery_conf import celery_app
-from mail import create_message, send_message_sync
+from config import Config
+from db.db import async_session
+from mail import create_message, send_message_sync, send_batch_sync, close_worker_loop, get_worker_loop, smtp_pool, \
+    load_templates, render_template
+from api.v1.auth.outbox import dispatch_outbox
+
+
+def email_body(template: Optional[str], context: Optional[dict], body: Optional[str]) -> str:
+    """Renders the template, or passes through a pre-rendered body. Jobs queued before templates were
+    rendered by the worker carry (recipients, subject, body), so a third argument without a context
+    is that body."""
+    if body is not None:
+        return body
+    if context is None:
+        return template
+    return render_template(template, context)
 
 
 @celery_app.task()
-def send_email(recipients: list[str], subject: str, body: str):
+def send_email(recipients: list[str], subject: str, template: Optional[str] = None, context: Optional[dict] = None,
+               body: Optional[str] = None):
 
     message = create_message(
         recipients=recipients,
         subject=subject,
-        body=body
+        body=email_body(template, context, body)
+    )
+
+    send_message_sync(message)
+
+
+@celery_app.task(bind=True)
+def send_bulk_email(self, recipients: list[str], subject: str, template: Optional[str] = None,
+                    context: Optional[dict] = None, body: Optional[str] = None):
+    """Sends one copy of the email to each recipient, MAIL_BULK_BATCH_SIZE recipients per SMTP session,
+    publishing progress after every batch. A refused recipient is recorded and the job carries on."""
+    body = email_body(template, context, body)
+    progress = {"total": len(recipients), "sent": 0, "failed": 0, "failures": []}
+    self.update_state(state="PROGRESS", meta=progress)
+
+    for start in range(0, len(recipients), Config.MAIL_BULK_BATCH_SIZE):
+        batch = recipients[start:start + Config.MAIL_BULK_BATCH_SIZE]
+
+        # A message per recipient keeps the list private and lets the server refuse one address at a time.
+        # An address that cannot become a message is recorded like a refusal instead of ending the job
+        errors, ready, messages = [None] * len(batch), [], []
+        for i, recipient in enumerate(batch):
+            try:
+                messages.append(create_message(recipients=[recipient], subject=subject, body=body))
+                ready.append(i)
+            except ValueError as e:
+                errors[i] = e
+
+        if messages:
+            for i, error in zip(ready, send_batch_sync(messages)):
+                errors[i] = error
+
+        for recipient, error in zip(batch, errors):
+            if error is None:
+                progress["sent"] += 1
+            else:
+                progress["failed"] += 1
+                progress["failures"].append({"recipient": recipient, "error": str(error)})
+
+        self.update_state(state="PROGRESS", meta=progress)
+
+    return progress
+
+
+@celery_app.task()
+def dispatch_email_outbox():
+    """Sends the emails waiting in the outbox straight over the worker's SMTP pool, run by celery beat
+    every MAIL_OUTBOX_INTERVAL seconds. Rows wait in the database while the broker is down."""
+    return get_worker_loop().run_until_complete(
+        dispatch_outbox(async_session, smtp_pool.send_batch, Config.MAIL_OUTBOX_BATCH_SIZE)
     )
 
-    send_message_sync(message)
\ No newline at end of file
+
+def get_bulk_email_progress(job_id: str) -> dict:
+    """Reads a bulk email job's state and counts from the Celery result backend"""
+    result = AsyncResult(job_id, app=celery_app)
+    job = {"job_id": job_id, "state": result.state}
+
+    if result.state in ("PROGRESS", "SUCCESS"):
+        job.update(result.info)
+    elif result.state == "FAILURE":
+        job["error"] = str(result.info)
+
+    return job
+
+
+@worker_process_init.connect
+def compile_email_templates(**kwargs):
+    """Compiles the email templates once as each worker process starts"""
+    load_templates()
+
+
+@worker_process_shutdown.connect
+def close_smtp_connections(**kwargs):
+    """Says QUIT on the pooled SMTP connections when a worker process exits"""
+    close_worker_loop()
@@ -1,16 +1,22 @@
+import hashlib
+
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer
 from fastapi.requests import Request
 from sqlmodel.ext.asyncio.session import AsyncSession
-from typing import List, Any
+from typing import List, Any, Optional
 
 from api.v1.auth.models import User
+from api.v1.auth.cache import get_cached_principal, cache_principal, get_verified_token, cache_verified_token
+from api.v1.auth.schema import Principal
 from api.v1.auth.service import UserService
 from api.v1.auth.utils import decode_token
-from db.db import get_session
+from config import Config
+from db.db import get_session, get_read_session
+from db.rate_limit import parse_rate, rate_limiter
 from db.redis import jti_in_blocklist
 from errors import AccessTokenRequired, RefreshTokenRequired, InvalidToken, RevokedToken, InsufficientPermission, \
-    AccountNotVerified
+    AccountNotVerified, RateLimited
 
 
 class TokenBearer(HTTPBearer):
@@ -23,10 +29,7 @@ class TokenBearer(HTTPBearer):
     async def __call__(self, request: Request) -> dict:
         creds = await super().__call__(request)
         token = creds.credentials
-        token_data = decode_token(token)
-
-        if not self.token_valid(token):
-            raise InvalidToken()
+        token_data = self.verify_token(token)
 
         if await jti_in_blocklist(token_data['jti']):
             raise RevokedToken()
@@ -36,9 +39,19 @@ class TokenBearer(HTTPBearer):
         return token_data
 
     @staticmethod
-    def token_valid(token: str) -> bool:
-        token_data = decode_token(token)
-        return bool(token_data)
+    def verify_token(token: str) -> dict:
+        # Signature and expiry are checked once per token; repeat requests are served from the verified-token LRU
+        token_data = get_verified_token(token)
+
+        if token_data is None:
+            token_data = decode_token(token)
+
+            if not token_data:
+                raise InvalidToken()
+
+            cache_verified_token(token, token_data)
+
+        return token_data
 
     @staticmethod
     def verify_token_data(token_data):
@@ -59,22 +72,81 @@ class RefreshTokenBearer(TokenBearer):
             raise RefreshTokenRequired
 
 
-async def get_current_user(token_details: dict = Depends(AccessTokenBearer()), session: AsyncSession = Depends(get_session)):
+async def get_current_user(token_details: dict = Depends(AccessTokenBearer()), session: AsyncSession = Depends(get_read_session)) -> User:
     user_email = token_details['user']['email']
     user = await UserService.get_user_by_email(user_email, session)
     return user
 
 
+async def get_current_principal(token_details: dict = Depends(AccessTokenBearer()), session: AsyncSession = Depends(get_session)) -> Principal:
+    user_uid = token_details['user']['user_uid']
+    principal = get_cached_principal(user_uid)
+
+    if principal is None:
+        principal = await UserService.get_principal(user_uid, session)
+
+        if principal is None:
+            raise InvalidToken()
+
+        cache_principal(principal)
+
+    return principal
+
+
 class CheckRole:
 
     def __init__(self, allowed_roles: List[str]) -> None:
         self.allowed_roles = allowed_roles
 
-    async def __call__(self, current_user: User = Depends(get_current_user)) -> Any:
-        if not current_user.is_verified:
+    async def __call__(self, principal: Principal = Depends(get_current_principal)) -> Any:
+        if not principal.is_verified:
             raise AccountNotVerified
 
-        if current_user.role in self.allowed_roles:
+        if principal.role in self.allowed_roles:
             return True
 
-        raise InsufficientPermission()
\ No newline at end of file
+        raise InsufficientPermission()
+
+
+class RateLimit:
+    """Token bucket limits for one route, per client IP and optionally per account named in the JSON body,
+    e.g. dependencies=[Depends(RateLimit("login", "20/minute", "5/minute"))]"""
+
+    def __init__(self, scope: str, per_ip: str, per_account: Optional[str] = None, account_field: str = "email") -> None:
+        self.scope = scope
+        self.per_ip = parse_rate(per_ip)
+        self.per_account = parse_rate(per_account) if per_account else None
+        self.account_field = account_field
+
+    async def __call__(self, request: Request) -> None:
+        if not Config.RATE_LIMIT_ENABLED:
+            return
+
+        buckets = []
+
+        if self.per_account:
+            # FastAPI has already read the body, so this is served from the request's cache
+            try:
+                body = await request.json()
+            except ValueError:
+                body = None
+            account = body.get(self.account_field) if isinstance(body, dict) else None
+            if isinstance(account, str) and account:
+                # Hashed, so an arbitrarily long body value becomes a fixed-size Redis key
+                account_key = hashlib.sha256(account.strip().lower().encode()).hexdigest()
+                buckets.append((f"{self.scope}:account:{account_key}", self.per_account))
+
+        # The account bucket is taken first, so a request it refuses never spends the client's IP token
+        client_ip = request.client.host if request.client else "unknown"
+        buckets.append((f"{self.scope}:ip:{client_ip}", self.per_ip))
+
+        # Refuse from local state first, so a flood against a known-empty bucket spends no Redis calls
+        for key, _ in buckets:
+            retry_after = rate_limiter.known_empty(self.scope, key)
+            if retry_after:
+                raise RateLimited(retry_after)
+
+        for key, rate in buckets:
+            retry_after = await rate_limiter.take(self.scope, key, rate)
+            if retry_after:
+                raise RateLimited(retry_after)
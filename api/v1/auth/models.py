@@ -1,8 +1,9 @@
 import uuid
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 import sqlalchemy.dialects.postgresql as pg
+from sqlalchemy import JSON
 from sqlmodel import SQLModel, Field, Column, Relationship
 
 from api.v1.books.models import Book
@@ -17,20 +18,43 @@ class User(SQLModel, table=True):
             pg.UUID,
             nullable=False,
             primary_key=True,
-            default=uuid.uuid4()
+            default=uuid.uuid4
         )
     )
     username: str
-    email: str
+    email: str = Field(index=True, unique=True)  # Looked up on every login
     first_name: str
     last_name: str
     role: str = Field(sa_column=Column(pg.VARCHAR, nullable=False, server_default="user"))
     is_verified: bool = False
     password_hash: str = Field(exclude=True)   # Exclude from Serialization
-    created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now()))
-    updated_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now()))
+    created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
+    updated_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
     books: List["Book"] = Relationship(back_populates="user", sa_relationship_kwargs={"lazy": "selectin"})  # Lazy loading enabled
     reviews: List["Review"] = Relationship(back_populates="user", sa_relationship_kwargs={"lazy": "selectin"})
 
     def __str__(self):
-        return f"<User {self.username}>"
\ No newline at end of file
+        return f"<User {self.username}>"
+
+
+class EmailOutbox(SQLModel, table=True):
+    """Emails written in the same transaction as the change that triggers them, sent later by the outbox dispatcher"""
+    __tablename__ = "email_outbox"
+
+    uid: uuid.UUID = Field(
+        sa_column=Column(
+            pg.UUID,
+            nullable=False,
+            primary_key=True,
+            default=uuid.uuid4
+        )
+    )
+    recipient: str
+    subject: str
+    template: Optional[str] = None  # Rendered by the dispatcher with context
+    context: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    body: Optional[str] = None  # Ready-made HTML, for rows without a template
+    attempts: int = Field(sa_column=Column(pg.INTEGER, nullable=False, server_default="0", default=0))
+    next_attempt_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, nullable=False, index=True, default=datetime.now))  # Drain order
+    last_error: Optional[str] = None
+    created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
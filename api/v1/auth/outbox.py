@@ -0,0 +1,89 @@
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional
+
+from pydantic import EmailStr, TypeAdapter, ValidationError
+from sqlalchemy import delete
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import Config
+from mail import create_message, render_template
+from .models import EmailOutbox
+
+email_address_adapter = TypeAdapter(EmailStr)
+
+
+def add_outbox_email(session: AsyncSession, recipient: str, subject: str, template: str, context: dict) -> EmailOutbox:
+    """ Queues a templated email in the session; it is only sent once the caller's transaction commits.
+    Raises ValidationError for a malformed recipient, which could never be sent. """
+    recipient = email_address_adapter.validate_python(recipient)
+    now = datetime.now()
+    email = EmailOutbox(uid=uuid.uuid4(), recipient=recipient, subject=subject, template=template, context=context,
+                        attempts=0, next_attempt_at=now, created_at=now)
+    session.add(email)
+    return email
+
+
+def render_body(email: EmailOutbox) -> str:
+    return render_template(email.template, email.context or {}) if email.template else email.body
+
+
+async def dispatch_outbox(session_factory: sessionmaker, send: Callable[[list], Awaitable[List[Optional[Exception]]]],
+                          batch_size: int) -> dict:
+    """ Sends due outbox emails batch by batch until none are left. Each batch is locked with SKIP LOCKED,
+    so dispatchers running side by side never pick the same row, and is removed or rescheduled in the
+    same transaction. A crash between the send and the commit sends those emails again. """
+    stats = {"sent": 0, "failed": 0}
+
+    while True:
+        now = datetime.now()
+        statement = (
+            select(EmailOutbox)
+            .where(EmailOutbox.next_attempt_at <= now, EmailOutbox.attempts < Config.MAIL_OUTBOX_MAX_ATTEMPTS)
+            .order_by(EmailOutbox.next_attempt_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+
+        async with session_factory() as session:
+            emails = (await session.exec(statement)).all()
+            if not emails:
+                break
+
+            # A row that cannot be turned into a message fails on its own instead of aborting the batch
+            errors, ready, messages = {}, [], []
+            for email in emails:
+                try:
+                    messages.append(create_message(recipients=[email.recipient], subject=email.subject, body=render_body(email)))
+                    ready.append(email)
+                except Exception as e:
+                    errors[email.uid] = e
+
+            if messages:
+                errors.update(zip([email.uid for email in ready], await send(messages)))
+
+            sent = [email.uid for email in emails if errors[email.uid] is None]
+            for email in emails:
+                error = errors[email.uid]
+                if error is None:
+                    continue
+
+                if isinstance(error, ValidationError):
+                    email.attempts = Config.MAIL_OUTBOX_MAX_ATTEMPTS  # A malformed address never succeeds, park it at once
+                else:
+                    email.attempts += 1
+                    email.next_attempt_at = now + timedelta(seconds=Config.MAIL_OUTBOX_RETRY_DELAY * 2 ** (email.attempts - 1))
+                email.last_error = str(error)[:500]
+
+            if sent:
+                await session.exec(delete(EmailOutbox).where(EmailOutbox.uid.in_(sent)))
+            await session.commit()
+
+        stats["sent"] += len(sent)
+        stats["failed"] += len(emails) - len(sent)
+        if len(emails) < batch_size:
+            break
+
+    return stats
@@ -2,46 +2,51 @@ from datetime import timedelta, datetime
 
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
-from fastapi import status, APIRouter, Depends, BackgroundTasks
+from fastapi import status, APIRouter, Depends
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from api.v1.auth.dependency import RefreshTokenBearer, AccessTokenBearer, get_current_user, CheckRole
+from api.v1.auth.dependency import RefreshTokenBearer, AccessTokenBearer, get_current_user, CheckRole, RateLimit
 from api.v1.auth.models import User
 from api.v1.auth.schema import UserCreateModel, UserLoginModel, UserModel, EmailModel, PasswordResetRequestModel, \
     PasswordResetConfirmModel
 from api.v1.auth.service import UserService
-from api.v1.auth.utils import verify_password, create_access_token, create_url_safe_token, decode_url_safe_token, \
-    generate_password_hash
+from api.v1.auth.utils import verify_password_async, create_access_token, create_url_safe_token, decode_url_safe_token, \
+    generate_password_hash_async, get_password_hash_stats
 from config import Config
 from db.db import get_session
 from db.redis import add_jti_to_blocklist
 from errors import UserAlreadyExists, UserNotFound, IncorrectPassword, RefreshTokenExpired, PasswordDoNotMatch
-from mail import create_message, mail
-from api.v1.auth.celery_send_email import send_email
+from api.v1.auth.celery_send_email import send_bulk_email, get_bulk_email_progress
+from api.v1.auth.outbox import add_outbox_email
 
 auth_router = APIRouter()
 user_service = UserService()
 role_checker = CheckRole(['admin', 'user'])
+admin_checker = CheckRole(['admin'])
+login_limit = RateLimit("login", Config.RATE_LIMIT_LOGIN_PER_IP, Config.RATE_LIMIT_LOGIN_PER_ACCOUNT)
+signup_limit = RateLimit("signup", Config.RATE_LIMIT_SIGNUP_PER_IP)
+password_reset_limit = RateLimit("password_reset", Config.RATE_LIMIT_PASSWORD_RESET_PER_IP, Config.RATE_LIMIT_PASSWORD_RESET_PER_ACCOUNT)
 
 
-@auth_router.post('/send-mail', status_code=status.HTTP_200_OK)
-def send_mail(emails: EmailModel, backgroundTask: BackgroundTasks):
+@auth_router.post('/send-mail', status_code=status.HTTP_202_ACCEPTED)
+def send_mail(emails: EmailModel):
     emails = emails.addresses
 
-    html = "<h1>Welcome to the App</h1>"
+    job = send_bulk_email.delay(emails, "Welcome", "welcome.html", {})
 
-    message = create_message(
-        recipients=emails,
-        subject="Welcome",
-        body=html
-    )
+    return {
+        "message": "Email job queued",
+        "job_id": job.id,
+        "total": len(emails)
+    }
 
-    backgroundTask.add_task(mail.send_message, message)
 
-    return {"message": "Email sent successfully!"}
+@auth_router.get('/send-mail/{job_id}')
+def send_mail_progress(job_id: str):
+    return get_bulk_email_progress(job_id)
 
 
-@auth_router.post('/signup', status_code=status.HTTP_201_CREATED)
+@auth_router.post('/signup', status_code=status.HTTP_201_CREATED, dependencies=[Depends(signup_limit)])
 async def create_user_account(user_data: UserCreateModel, session: AsyncSession = Depends(get_session)):
     user_email = user_data.email
     user_exists = await user_service.user_exists(user_email, session)
@@ -49,20 +54,13 @@ async def create_user_account(user_data: UserCreateModel, session: AsyncSession
     if user_exists:
         raise UserAlreadyExists()
 
-    new_user = await user_service.create_user_account(user_data, session)
-
     token = create_url_safe_token({"email": user_email})
 
     link = f"http://{Config.DOMAIN_NAME}/api/v1/auth/verify/{token}"
 
-    emails = [user_email]
-    subject = "Verify your email"
-    account_verification_message = f"""
-    <h1>Verify your Email</h1>
-    <p>Please click this <a href="{link}">link</a> to verify your email</p>
-    """
-
-    send_email.delay(emails, subject, account_verification_message)
+    # Committed together with the user, so the email cannot be lost and signup never waits on the broker
+    add_outbox_email(session, user_email, "Verify your email", "verify_email.html", {"link": link})
+    new_user = await user_service.create_user_account(user_data, session)
 
     return {
         "message": "Account created please verify your email",
@@ -94,7 +92,7 @@ async def verify_user_account(token: str, session: AsyncSession = Depends(get_se
     )
 
 
-@auth_router.post('/login', response_model=User, status_code=status.HTTP_200_OK)
+@auth_router.post('/login', response_model=User, status_code=status.HTTP_200_OK, dependencies=[Depends(login_limit)])
 async def login_user_account(login_data: UserLoginModel, session: AsyncSession = Depends(get_session)):
     email = login_data.email
     password = login_data.password
@@ -104,7 +102,7 @@ async def login_user_account(login_data: UserLoginModel, session: AsyncSession =
     if user is None:
         raise UserNotFound()
 
-    if not verify_password(password, user.password_hash):
+    if not await verify_password_async(password, user.password_hash):
         raise IncorrectPassword()
 
     access_token = create_access_token(
@@ -176,6 +174,12 @@ async def get_current_user_account(current_user: dict = Depends(get_current_user
     return current_user
 
 
+# Password hashing pool counters for this worker
+@auth_router.get('/password-hash/stats', status_code=status.HTTP_200_OK)
+async def get_password_hashing_stats(_: bool = Depends(admin_checker)) -> dict:
+    return get_password_hash_stats()
+
+
 @auth_router.post('/logout', status_code=status.HTTP_200_OK)
 async def logout_user_account(token_details: dict = Depends(AccessTokenBearer())):
     jti = token_details['jti']
@@ -184,22 +188,16 @@ async def logout_user_account(token_details: dict = Depends(AccessTokenBearer())
     return JSONResponse(content={"message": "Logged out Successfully"})
 
 
-@auth_router.post('/password-reset', status_code=status.HTTP_200_OK)
-async def password_reset(email_data: PasswordResetRequestModel):
+@auth_router.post('/password-reset', status_code=status.HTTP_200_OK, dependencies=[Depends(password_reset_limit)])
+async def password_reset(email_data: PasswordResetRequestModel, session: AsyncSession = Depends(get_session)):
     user_email = email_data.email
 
     token = create_url_safe_token({"email": user_email})
 
     link = f"http://{Config.DOMAIN_NAME}/api/v1/auth/password-reset-confirm/{token}"
 
-    emails = [user_email]
-    subject = "Password Reset"
-    password_reset_message = f"""
-    <h1>Reset Your Password</h1>
-    <p>Please click this <a href="{link}">link</a> to reset your password</p>
-    """
-
-    send_email.delay(emails, subject, password_reset_message)
+    add_outbox_email(session, user_email, "Password Reset", "password_reset.html", {"link": link})
+    await session.commit()
 
     return {
         "message": "Please check your email on instruction to reset your password",
@@ -224,7 +222,7 @@ async def password_reset_confirm(token: str, passwords: PasswordResetConfirmMode
             raise UserNotFound
 
 
-        password_hash = generate_password_hash(new_password)
+        password_hash = await generate_password_hash_async(new_password)
         await user_service.update_user(user, {"password_hash": password_hash}, session)
 
         return JSONResponse(
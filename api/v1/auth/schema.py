@@ -2,7 +2,7 @@ import uuid
 from datetime import datetime
 from typing import List
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, EmailStr, Field
 
 from api.v1.books.models import Book
 
@@ -20,11 +20,19 @@ class UserModel(BaseModel):
     books: List[Book]
 
 
+class Principal(BaseModel):
+    """The authenticated user as seen by authorization checks, without the books and reviews graph"""
+    uid: uuid.UUID
+    email: str
+    role: str
+    is_verified: bool
+
+
 class UserCreateModel(BaseModel):
     first_name: str = Field(max_length=25)
     last_name: str = Field(max_length=25)
     username: str = Field(max_length=8)
-    email: str = Field(max_length=50)
+    email: EmailStr = Field(max_length=50)
     password: str = Field(min_length=8)
 
 
@@ -34,11 +42,11 @@ class UserLoginModel(BaseModel):
 
 
 class EmailModel(BaseModel):
-    addresses: List[str]
+    addresses: List[EmailStr]
 
 
 class PasswordResetRequestModel(BaseModel):
-    email: str
+    email: EmailStr
 
 
 class PasswordResetConfirmModel(BaseModel):
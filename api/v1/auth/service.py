@@ -4,9 +4,10 @@ from datetime import datetime
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from .cache import invalidate_principal
 from .models import User
-from .schema import UserCreateModel
-from .utils import generate_password_hash
+from .schema import UserCreateModel, Principal
+from .utils import generate_password_hash_async
 
 
 class UserService:
@@ -19,6 +20,15 @@ class UserService:
         return user
 
 
+    @staticmethod
+    async def get_principal(user_uid: str, session: AsyncSession):
+        # Select only the columns authorization needs, so the books and reviews relationships are never loaded
+        statement = select(User.uid, User.email, User.role, User.is_verified).where(User.uid == user_uid)
+        result = await session.exec(statement)
+        row = result.first()
+        return Principal(**row._mapping) if row is not None else None
+
+
     async def user_exists(self, email: str, session: AsyncSession):
         user = await self.get_user_by_email(email, session)
         return True if user is not None else False
@@ -28,7 +38,7 @@ class UserService:
     async def create_user_account(user_data: UserCreateModel, session: AsyncSession):
         user_data_dict = user_data.model_dump()  # Convert to dictionary
         new_user = User(**user_data_dict, uid=uuid.uuid4(), created_at=datetime.now(), updated_at=datetime.now())
-        new_user.password_hash = generate_password_hash(user_data_dict['password'])
+        new_user.password_hash = await generate_password_hash_async(user_data_dict['password'])
         new_user.role = "user"
         session.add(new_user)
         await session.commit()
@@ -42,5 +52,6 @@ class UserService:
             setattr(user, k, v)
 
         await session.commit()
+        invalidate_principal(user.uid)
 
         return user
\ No newline at end of file
@@ -1,5 +1,7 @@
+import asyncio
 import logging
 import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import timedelta, datetime
 
 import jwt
@@ -7,6 +9,8 @@ from itsdangerous import URLSafeTimedSerializer
 from passlib.context import CryptContext
 
 from config import Config
+from errors import PasswordHashingBusy
+from metrics import register_collector
 
 password_context = CryptContext(
     schemes=['bcrypt']
@@ -24,6 +28,69 @@ def verify_password(password: str, hashed_password: str) -> bool:
     return password_context.verify(password, hashed_password)
 
 
+# bcrypt releases the GIL while hashing, so a small thread pool keeps it off the event loop
+password_hash_pool = ThreadPoolExecutor(max_workers=Config.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+password_hash_stats = {"in_flight": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+
+def get_password_hash_stats() -> dict:
+    """ Returns the hashing pool counters, including how many calls are waiting for a free thread. """
+    queued = max(0, password_hash_stats["in_flight"] - Config.PASSWORD_HASH_WORKERS)
+    return {**password_hash_stats, "queued": queued, "workers": Config.PASSWORD_HASH_WORKERS}
+
+
+def collect_password_hash_metrics() -> list:
+    stats = get_password_hash_stats()
+    return [
+        "# TYPE password_hash_in_flight gauge",
+        f"password_hash_in_flight {stats['in_flight']}",
+        "# TYPE password_hash_queued gauge",
+        f"password_hash_queued {stats['queued']}",
+        "# TYPE password_hash_completed_total counter",
+        f"password_hash_completed_total {stats['completed']}",
+        "# TYPE password_hash_failed_total counter",
+        f"password_hash_failed_total {stats['failed']}",
+        "# TYPE password_hash_rejected_total counter",
+        f"password_hash_rejected_total {stats['rejected']}",
+    ]
+
+
+register_collector(collect_password_hash_metrics)
+
+
+def _finish_password_hash(future: Future) -> None:
+    password_hash_stats["in_flight"] -= 1
+    if future.cancelled() or future.exception() is not None:
+        password_hash_stats["failed"] += 1
+    else:
+        password_hash_stats["completed"] += 1
+
+
+async def run_in_password_hash_pool(func, *args):
+    """ Runs a bcrypt call on the hashing pool, rejecting it at once when the pool is saturated. """
+    if password_hash_stats["in_flight"] >= Config.PASSWORD_HASH_MAX_PENDING:
+        password_hash_stats["rejected"] += 1
+        raise PasswordHashingBusy()
+
+    loop = asyncio.get_running_loop()
+    future = password_hash_pool.submit(func, *args)
+    password_hash_stats["in_flight"] += 1
+    # Counted down when the thread is done rather than when the caller stops waiting, so a cancelled
+    # request's hash keeps its slot until bcrypt actually finishes. Registered before wrap_future's own
+    # callback, so the counters are updated before the caller resumes
+    future.add_done_callback(lambda done: loop.call_soon_threadsafe(_finish_password_hash, done))
+    return await asyncio.wrap_future(future)
+
+
+async def generate_password_hash_async(password: str) -> str:
+    return await run_in_password_hash_pool(generate_password_hash, password)
+
+
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+    return await run_in_password_hash_pool(verify_password, password, hashed_password)
+
+
 def create_access_token(user_data: dict, expiry: timedelta = None, refresh: bool = False):
     payload = {
         'user': user_data,
@@ -0,0 +1,185 @@
+import codecs
+import csv
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, List
+
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import Config
+from errors import UnsupportedImportFormat
+from .models import Book
+from .schema import BookCreateModel
+
+IMPORT_FORMATS = {
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+
+# Columns written by COPY; the rating statistics and search vector are filled in by Postgres
+IMPORT_COLUMNS = ["uid", "title", "author", "publisher", "published_date", "page_count", "language",
+                  "user_uid", "created_at", "updated_at"]
+
+book_batch_adapter = TypeAdapter(List[BookCreateModel])
+
+
+def import_format(content_type: str) -> str:
+    """ Maps the request Content-Type to an import format, ignoring parameters such as charset. """
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type not in IMPORT_FORMATS:
+        raise UnsupportedImportFormat()
+    return IMPORT_FORMATS[media_type]
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """ Splits a streamed UTF-8 body into lines without holding more than one chunk in memory. """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_rows(lines: AsyncIterator[str], fmt: str) -> AsyncIterator[tuple]:
+    """ Yields (line number, row dict or parse error message) for every non-empty record of the body. """
+    header = None
+    record_lines, record_start, record_size, open_quote = [], 0, 0, False
+    line_number = 0
+
+    async for line in lines:
+        line_number += 1
+        if fmt == "ndjson":
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+                yield line_number, row if isinstance(row, dict) else "Row is not a JSON object"
+            except ValueError as e:
+                yield line_number, f"Invalid JSON: {e}"
+            continue
+
+        # A quoted CSV field may contain newlines, so keep reading until the quotes balance. Parity is kept
+        # per line, and a record past the caps is rejected, so a stray quote cannot swallow the whole body
+        if not record_lines:
+            record_start = line_number
+        record_lines.append(line)
+        record_size += len(line)
+        open_quote ^= line.count('"') % 2 == 1
+        if open_quote:
+            if len(record_lines) >= Config.BOOK_IMPORT_MAX_RECORD_LINES or record_size >= Config.BOOK_IMPORT_MAX_RECORD_BYTES:
+                yield record_start, f"Record starting on line {record_start} has an unterminated quoted field"
+                record_lines, record_size, open_quote = [], 0, False
+            continue
+
+        record = "\n".join(record_lines)
+        record_lines, record_size = [], 0
+        values = next(csv.reader([record])) if record.strip() else []
+        if not values:
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+        elif len(values) != len(header):
+            yield record_start, f"Expected {len(header)} fields, got {len(values)}"
+        else:
+            yield record_start, dict(zip(header, values))
+
+    if record_lines:
+        yield record_start, f"Record starting on line {record_start} has an unterminated quoted field"
+
+
+def validate_batch(rows: List[tuple]) -> tuple:
+    """ Validates a batch in one pass, falling back to row by row only when some row is invalid. """
+    try:
+        return book_batch_adapter.validate_python([row for _, row in rows]), []
+    except ValidationError:
+        pass
+
+    books, errors = [], []
+    for line, row in rows:
+        try:
+            books.append(BookCreateModel.model_validate(row))
+        except ValidationError as e:
+            errors.append({"line": line, "errors": [f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()]})
+    return books, errors
+
+
+@asynccontextmanager
+async def book_writer(session: AsyncSession):
+    """ Yields a function that writes a batch of IMPORT_COLUMNS records: COPY on Postgres, executemany elsewhere. """
+    connection = await session.connection()
+    if connection.dialect.driver != "asyncpg":
+        async def insert_records(records: List[tuple]) -> None:
+            await connection.execute(insert(Book.__table__), [dict(zip(IMPORT_COLUMNS, record)) for record in records])
+
+        yield insert_records
+        return
+
+    driver_connection = (await connection.get_raw_connection()).driver_connection
+
+    async def copy_records(records: List[tuple]) -> None:
+        await driver_connection.copy_records_to_table(Book.__tablename__, records=records, columns=IMPORT_COLUMNS)
+
+    # SQLAlchemy only begins its transaction on the first statement it runs, so COPY on the driver connection
+    # would commit batch by batch; this transaction (a savepoint if one is already open) keeps it all or nothing
+    async with driver_connection.transaction():
+        yield copy_records
+
+
+async def import_books(chunks: AsyncIterator[bytes], fmt: str, user_uid: str, session: AsyncSession) -> dict:
+    """ Streams rows into the books table in batches, all in one transaction. Invalid rows are skipped
+    and reported; a database error rolls the whole import back. """
+    start_time = time.perf_counter()
+    owner = uuid.UUID(str(user_uid))
+    stats = {"imported": 0, "rejected": 0, "errors": []}
+
+    def reject(errors: List[dict]) -> None:
+        stats["rejected"] += len(errors)
+        stats["errors"].extend(errors[:max(0, Config.BOOK_IMPORT_MAX_ERRORS - len(stats["errors"]))])
+
+    async def flush(write, batch: List[tuple]) -> None:
+        books, errors = validate_batch(batch)
+        reject(errors)
+        if books:
+            now = datetime.now()
+            records = [(uuid.uuid4(), book.title, book.author, book.publisher, book.published_date, book.page_count,
+                        book.language, owner, now, now) for book in books]
+            await write(records)
+            stats["imported"] += len(records)
+
+    try:
+        async with book_writer(session) as write:
+            batch = []
+            async for line, row in iter_rows(iter_lines(chunks), fmt):
+                if isinstance(row, str):
+                    reject([{"line": line, "errors": [row]}])
+                    continue
+
+                batch.append((line, row))
+                if len(batch) >= Config.BOOK_IMPORT_BATCH_SIZE:
+                    await flush(write, batch)
+                    batch = []
+
+            if batch:
+                await flush(write, batch)
+        await session.commit()
+
+    except BaseException:
+        await session.rollback()
+        raise
+
+    seconds = time.perf_counter() - start_time
+    stats["seconds"] = round(seconds, 3)
+    stats["rows_per_second"] = round(stats["imported"] / seconds) if seconds else 0
+    return stats
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import uuid
+from typing import Optional
+
+from redis.exceptions import RedisError
+
+from config import Config
+from db.db import replica_engines
+from db.redis import redis_client
+from metrics import register_collector
+from .schema import BookDetailModel
+
+BOOK_CACHE_PREFIX = "book:"
+
+# Process-local counters, read by the cache stats endpoint
+cache_stats = {"hits": 0, "misses": 0, "errors": 0}
+
+# The event loop only keeps weak references to tasks, so pending delayed deletes are held here until they finish
+_pending_deletes = set()
+
+
+def collect_cache_metrics() -> list:
+    lines = ["# TYPE book_cache_requests_total counter"]
+    lines.extend(f'book_cache_requests_total{{result="{result}"}} {count}' for result, count in cache_stats.items())
+    return lines
+
+
+register_collector(collect_cache_metrics)
+
+
+def book_cache_key(book_uid: str) -> Optional[str]:
+    """ Builds the Redis key for a book, or None when the uid is not a valid UUID. """
+    try:
+        return BOOK_CACHE_PREFIX + str(uuid.UUID(str(book_uid)))
+    except ValueError:
+        return None
+
+
+async def get_cached_book(book_uid: str) -> Optional[BookDetailModel]:
+    """ Returns the cached book detail, or None on a miss or when Redis is unavailable. """
+    key = book_cache_key(book_uid)
+    if key is None:
+        return None
+
+    try:
+        data = await redis_client.get(key)
+    except RedisError as e:
+        cache_stats["errors"] += 1
+        logging.warning(f"Book cache read failed: {e}")
+        return None
+
+    if data is None:
+        cache_stats["misses"] += 1
+        return None
+
+    cache_stats["hits"] += 1
+    return BookDetailModel.model_validate_json(data)
+
+
+async def cache_book(book: BookDetailModel) -> None:
+    """ Stores a serialized book detail in Redis for BOOK_CACHE_TTL seconds. """
+    try:
+        await redis_client.set(name=book_cache_key(book.uid), value=book.model_dump_json(), ex=Config.BOOK_CACHE_TTL)
+    except RedisError as e:
+        cache_stats["errors"] += 1
+        logging.warning(f"Book cache write failed: {e}")
+
+
+async def _delete_cached_book(key: str) -> None:
+    try:
+        await redis_client.delete(key)
+    except RedisError as e:
+        cache_stats["errors"] += 1
+        logging.warning(f"Book cache invalidation failed: {e}")
+
+
+def _schedule_delete(key: str) -> None:
+    task = asyncio.create_task(_delete_cached_book(key))
+    _pending_deletes.add(task)
+    task.add_done_callback(_pending_deletes.discard)
+
+
+async def invalidate_book(book_uid) -> None:
+    """ Drops a book from the cache so the next read reloads it from the database. """
+    key = book_cache_key(book_uid)
+    if key is None:
+        return
+
+    await _delete_cached_book(key)
+
+    if replica_engines:
+        # A read served by a lagging replica right after the write could cache the old row again,
+        # so delete once more after the replica has had time to catch up
+        asyncio.get_running_loop().call_later(Config.DB_REPLICA_LAG_WINDOW, _schedule_delete, key)
+
+
+async def drain_delayed_deletes() -> None:
+    """ Waits for the delayed deletes invalidate_book schedules, for scripts that exit right after invalidating. """
+    if replica_engines:
+        await asyncio.sleep(Config.DB_REPLICA_LAG_WINDOW)
+        await asyncio.gather(*_pending_deletes)
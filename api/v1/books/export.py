@@ -0,0 +1,63 @@
+import zlib
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import noload, sessionmaker
+from sqlmodel import select
+
+from config import Config
+from pagination import encode_cursor
+from .models import Book
+from .schema import BookModel, BookExportModel
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """ True when the Accept-Encoding header lists gzip with a non-zero quality. """
+    for coding in accept_encoding.split(","):
+        name, *params = coding.split(";")
+        if name.strip().lower() != "gzip":
+            continue
+
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        return quality > 0
+
+    return False
+
+
+def export_line(book: Book) -> str:
+    fields = BookModel.model_validate(book).__dict__
+    return BookExportModel.model_construct(**fields, cursor=encode_cursor(book.created_at, book.uid)).model_dump_json() + "\n"
+
+
+async def export_books(session_factory: sessionmaker, position: Optional[tuple] = None, compress: bool = False) -> AsyncIterator[bytes]:
+    """ Streams every book as NDJSON, oldest first, BOOK_EXPORT_CHUNK_SIZE rows at a time through a
+    server-side cursor, so memory use does not grow with the table. Each line carries the cursor to
+    resume the export after it, which stays valid even once that book is deleted. """
+    # wbits=31 writes a gzip container; each chunk is sync-flushed so a cut-off download decompresses
+    # cleanly up to its last complete chunk, and the client can resume from the last line it has
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    statement = select(Book).options(noload(Book.reviews)).order_by(Book.created_at, Book.uid)
+    if position is not None:
+        # New books sort after every existing one, so resuming neither skips nor repeats rows
+        statement = statement.where(tuple_(Book.created_at, Book.uid) > tuple_(*position))
+
+    async with session_factory() as session:
+        result = await session.stream_scalars(statement.execution_options(yield_per=Config.BOOK_EXPORT_CHUNK_SIZE))
+        async for books in result.partitions():
+            # The identity map only holds weak references, so each partition is freed once it is serialized
+            chunk = "".join(export_line(book) for book in books).encode()
+
+            if compressor:
+                chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield chunk
+
+    if compressor:
+        yield compressor.flush()
@@ -1,22 +1,37 @@
 import uuid
 from datetime import datetime, date
 import sqlalchemy.dialects.postgresql as pg
+from sqlalchemy import Computed, Float, Index, cast, func, literal_column
 from sqlmodel import SQLModel, Field, Column, Relationship
 from typing import Optional, List
 
 from api.v1.auth import models
 from api.v1.reviews.models import Review
 
+# Weighted so that title matches rank above author matches, which rank above publisher matches
+SEARCH_VECTOR_EXPRESSION = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(author, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(publisher, '')), 'C')"
+)
+
 
 class Book(SQLModel, table=True):
     __tablename__ = "books"
+    __table_args__ = (
+        Index("ix_books_created_at_uid", "created_at", "uid"),  # Backs keyset pagination on (created_at, uid)
+        Index("ix_books_user_uid_created_at_uid", "user_uid", "created_at", "uid"),  # Backs one user's pages
+        Index("ix_books_search_vector", "search_vector", postgresql_using="gin"),  # Backs full-text search
+    )
+    # search_vector is maintained by Postgres and only read through search queries, so keep it out of every ORM SELECT
+    __mapper_args__ = {"exclude_properties": ["search_vector"]}
 
     uid: uuid.UUID = Field(
         sa_column=Column(
             pg.UUID,
             nullable=False,
             primary_key=True,
-            default=uuid.uuid4()
+            default=uuid.uuid4
         )
     )
     title: str
@@ -26,11 +41,46 @@ class Book(SQLModel, table=True):
     page_count: int
     language: str
     user_uid: Optional[uuid.UUID] = Field(default=None, foreign_key="users.uid")
-    created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now()))
-    updated_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now()))
+    created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
+    updated_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
+    # Rating statistics, kept up to date by ReviewService.add_review_to_book in the review's transaction
+    review_count: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_sum: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_count_0: int = Field(default=0, sa_column_kwargs={"server_default": "0"})  # Histogram: reviews rated 0
+    rating_count_1: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_count_2: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_count_3: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_count_4: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    search_vector: Optional[str] = Field(
+        default=None,
+        exclude=True,   # Exclude from Serialization
+        sa_column=Column(
+            pg.TSVECTOR,
+            Computed(SEARCH_VECTOR_EXPRESSION, persisted=True)
+        )
+    )
     user: Optional["models.User"] = Relationship(back_populates="books")
-    reviews: List["Review"] = Relationship(back_populates="book", sa_relationship_kwargs={"lazy": "selectin"})
+    reviews: List["Review"] = Relationship(back_populates="book", passive_deletes=True, sa_relationship_kwargs={"lazy": "selectin"})  # Deleting a book leaves reviews to ON DELETE SET NULL
 
 
+    @property
+    def average_rating(self) -> Optional[float]:
+        return self.rating_sum / self.review_count if self.review_count else None
+
+    @property
+    def rating_histogram(self) -> List[int]:
+        """ Number of reviews per rating, indexed by rating. """
+        return [getattr(self, f"rating_count_{rating}") for rating in RATINGS]
+
     def __str__(self):
-        return f"<Book {self.title}>"
\ No newline at end of file
+        return f"<Book {self.title}>"
+
+
+RATINGS = range(0, 5)  # Ratings a review can give, see ReviewCreateModel
+
+# Sort key for "best rated first" lists, 0 for books without reviews. Queries must order by this exact
+# expression for Postgres to use the index below, so it is built from literals rather than bound parameters.
+RATING_AVERAGE = func.coalesce(
+    cast(Book.rating_sum, Float).op("/")(func.nullif(Book.review_count, literal_column("0"))), literal_column("0")
+)
+Index("ix_books_rating_average_uid", RATING_AVERAGE, Book.uid)
\ No newline at end of file
@@ -1,37 +1,71 @@
-from typing import List
-from fastapi import status, APIRouter, Depends
+from typing import Literal, Optional
+from fastapi import status, APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import sessionmaker
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from api.v1.auth.dependency import AccessTokenBearer, CheckRole
-from api.v1.books.schema import BookUpdateModel, BookCreateModel, BookDetailModel
+from api.v1.books.bulk_import import import_format, import_books
+from api.v1.books.cache import cache_stats
+from api.v1.books.export import accepts_gzip, export_books
+from api.v1.books.schema import BookUpdateModel, BookCreateModel, BookDetailModel, BookPageModel
 from api.v1.books.service import BookService
-from db.db import get_session
+from db.db import get_session, get_read_session, get_read_session_factory
 from errors import BookNotFound
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor
 
 book_router = APIRouter()
 book_service = BookService()
 access_token_bearer = AccessTokenBearer()
 role_checker = Depends(CheckRole(['admin', 'user']))
+admin_checker = Depends(CheckRole(['admin']))
 
 
-# GET all books existing in DB
-@book_router.get('/', response_model=List[BookDetailModel], dependencies=[role_checker])
-async def get_all_books(session: AsyncSession = Depends(get_session), token_details=Depends(access_token_bearer)):
-    books = await book_service.get_all_books(session)
+# GET all books existing in DB, one page at a time (pass next_cursor back as ?cursor= for the next page),
+# newest first or best rated first; a cursor only continues the sort order it was issued for
+@book_router.get('/', response_model=BookPageModel, dependencies=[role_checker])
+async def get_all_books(cursor: Optional[str] = None, limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), sort: Literal["newest", "rating"] = "newest", session: AsyncSession = Depends(get_read_session), token_details=Depends(access_token_bearer)):
+    books = await book_service.get_all_books(session, cursor, limit, sort)
     return books
 
 
-# GET all books submitted by a user
-@book_router.get('/user/{user_uid}', response_model=List[BookDetailModel], dependencies=[role_checker])
-async def get_user_book_submissions(user_uid: str, session: AsyncSession = Depends(get_session), token_details=Depends(access_token_bearer)):
-    books = await book_service.get_user_books(user_uid, session)
+# GET all books submitted by a user, one page at a time
+@book_router.get('/user/{user_uid}', response_model=BookPageModel, dependencies=[role_checker])
+async def get_user_book_submissions(user_uid: str, cursor: Optional[str] = None, limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), session: AsyncSession = Depends(get_read_session), token_details=Depends(access_token_bearer)):
+    books = await book_service.get_user_books(user_uid, session, cursor, limit)
     return books
 
 
-# Get book
+# Search books by title, author and publisher, best match first
+@book_router.get('/search', response_model=BookPageModel, dependencies=[role_checker])
+async def search_books(q: str = Query(min_length=1, max_length=200), cursor: Optional[str] = None, limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), session: AsyncSession = Depends(get_read_session), token_details=Depends(access_token_bearer)):
+    books = await book_service.search_books(q, session, cursor, limit)
+    return books
+
+
+# Stream the whole catalogue as NDJSON, oldest first, gzip-compressed when the client accepts it. To resume
+# a broken download pass the cursor of the last complete line as ?cursor=
+@book_router.get('/export', dependencies=[role_checker])
+async def export_catalogue(request: Request, cursor: Optional[str] = None, session_factory: sessionmaker = Depends(get_read_session_factory), token_details=Depends(access_token_bearer)):
+    # Decoded before the response starts, so a malformed cursor is still reported as an error status
+    position = decode_cursor(cursor) if cursor is not None else None
+    compress = accepts_gzip(request.headers.get('accept-encoding', ''))
+    headers = {'content-encoding': 'gzip', 'vary': 'Accept-Encoding'} if compress else {'vary': 'Accept-Encoding'}
+    # The handler's dependencies are torn down before a streamed body is sent, so the export opens its own session
+    return StreamingResponse(export_books(session_factory, position, compress), media_type='application/x-ndjson', headers=headers)
+
+
+# Book cache hit/miss counters for this worker
+@book_router.get('/cache/stats', dependencies=[admin_checker])
+async def get_book_cache_stats(token_details=Depends(access_token_bearer)) -> dict:
+    return cache_stats
+
+
+# Get book, served from the Redis cache when possible. ?review_limit=N returns only the newest N reviews,
+# page through the rest with GET /api/v1/reviews/book/{book_uid}
 @book_router.get('/{book_id}', response_model=BookDetailModel, dependencies=[role_checker])
-async def get_book(book_id: str, session: AsyncSession = Depends(get_session), token_details=Depends(access_token_bearer)):
-    book = await book_service.get_book(book_id, session)
+async def get_book(book_id: str, review_limit: Optional[int] = Query(default=None, ge=0, le=MAX_PAGE_SIZE), session: AsyncSession = Depends(get_read_session), token_details=Depends(access_token_bearer)):
+    book = await book_service.get_book_detail(book_id, session, review_limit)
 
     if book is None:
         raise BookNotFound()
@@ -41,7 +75,7 @@ async def get_book(book_id: str, session: AsyncSession = Depends(get_session), t
 
 # Get book for a specific user
 @book_router.get('/{book_id}/user/{user_id}', response_model=BookDetailModel, dependencies=[role_checker])
-async def get_book(book_id: str, session: AsyncSession = Depends(get_session), token_details=Depends(access_token_bearer)):
+async def get_book(book_id: str, session: AsyncSession = Depends(get_read_session), token_details=Depends(access_token_bearer)):
     user_uid = token_details['user']['user_uid']
     book = await book_service.get_user_book(book_id, user_uid, session)
 
@@ -58,6 +92,15 @@ async def create_a_book(book_data: BookCreateModel, session: AsyncSession = Depe
     return new_book
 
 
+# Bulk import from a streamed NDJSON (one book object per line) or CSV (header row first) body; valid rows
+# are written in one transaction, owned by the importing admin, and rejected rows are listed by line number
+@book_router.post('/import', status_code=status.HTTP_200_OK, dependencies=[admin_checker])
+async def bulk_import_books(request: Request, session: AsyncSession = Depends(get_session), token_details=Depends(access_token_bearer)) -> dict:
+    fmt = import_format(request.headers.get('content-type', ''))
+    user_uid = token_details['user']['user_uid']
+    return await import_books(request.stream(), fmt, user_uid, session)
+
+
 @book_router.patch('/{book_id}', status_code=status.HTTP_200_OK, response_model=BookDetailModel, dependencies=[role_checker])
 async def update_book(book_id: str, book_update_data: BookUpdateModel, session: AsyncSession = Depends(get_session), token_details=Depends(access_token_bearer)) -> dict:
     updated_book = await book_service.update_book(book_id, book_update_data, session)
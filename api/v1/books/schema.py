@@ -16,6 +16,8 @@ class BookModel(BaseModel):
     page_count: int
     language: str
     user_uid: Optional[uuid.UUID] = None
+    review_count: int = 0
+    average_rating: Optional[float] = None  # None until the book has a review
     created_at: datetime
     updated_at: datetime
 
@@ -23,13 +25,23 @@ class BookModel(BaseModel):
         from_attributes = True  # Enables ORM mode for Pydantic v2
 
 
+class BookExportModel(BookModel):
+    cursor: str  # Pass as ?cursor= to resume an export after this book
+
+
 class BookDetailModel(BookModel):
+    rating_histogram: List[int] = []  # Number of reviews per rating, indexed by rating
     reviews: List[ReviewModel] = []
 
     class Config:
         from_attributes = True  # Enables ORM mode for Pydantic v2
 
 
+class BookPageModel(BaseModel):
+    items: List[BookModel]
+    next_cursor: Optional[str] = None  # Pass back as ?cursor= to fetch the next page, None on the last page
+
+
 class BookCreateModel(BaseModel):
     title: str
     author: str
@@ -1,29 +1,86 @@
+import asyncio
 import uuid
 from datetime import datetime
+from typing import Optional
 
 from fastapi import Depends
+from sqlalchemy import delete, func, tuple_, update
+from sqlalchemy.orm import noload
 from sqlmodel import desc, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from .models import Book
-from .schema import BookCreateModel, BookUpdateModel
+from pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor, decode_rank_cursor, encode_rank_cursor
+from api.v1.reviews.models import Review
+from api.v1.reviews.schema import ReviewModel
+from .cache import get_cached_book, cache_book, invalidate_book
+from .models import Book, RATINGS, RATING_AVERAGE
+from .schema import BookCreateModel, BookUpdateModel, BookDetailModel
 
 
 class BookService:
 
-
     @staticmethod
-    async def get_all_books(session: AsyncSession):
-        statement = select(Book).order_by(desc(Book.created_at))
+    async def paginate(statement, cursor: Optional[str], limit: int, session: AsyncSession) -> dict:
+        """ Runs a keyset-paginated query over books ordered by (created_at, uid), newest first. """
+        if cursor is not None:
+            created_at, uid = decode_cursor(cursor)
+            statement = statement.where(tuple_(Book.created_at, Book.uid) < tuple_(created_at, uid))
+
+        # Fetch one extra row to know whether another page exists, and skip the reviews relationship
+        statement = statement.options(noload(Book.reviews)).order_by(desc(Book.created_at), desc(Book.uid)).limit(limit + 1)
         result = await session.exec(statement)
-        return result.all()
+        books = result.all()
+
+        next_cursor = None
+        if len(books) > limit:
+            books = books[:limit]
+            next_cursor = encode_cursor(books[-1].created_at, books[-1].uid)
+
+        return {"items": books, "next_cursor": next_cursor}
+
+
+    async def get_all_books(self, session: AsyncSession, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE, sort: str = "newest"):
+        if sort == "rating":
+            # Best rated first, served by ix_books_rating_average_uid
+            return await self.paginate_ranked(select(Book, RATING_AVERAGE), RATING_AVERAGE, cursor, limit, session)
+
+        statement = select(Book)
+        return await self.paginate(statement, cursor, limit, session)
+
+
+    async def get_user_books(self, user_uid: str, session: AsyncSession, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE):
+        statement = select(Book).where(Book.user_uid == user_uid)
+        return await self.paginate(statement, cursor, limit, session)
 
 
     @staticmethod
-    async def get_user_books( user_uid: str, session: AsyncSession):
-        statement = select(Book).where(Book.user_uid == user_uid).order_by(desc(Book.created_at))
+    async def paginate_ranked(statement, rank, cursor: Optional[str], limit: int, session: AsyncSession) -> dict:
+        """ Runs a keyset-paginated query selecting (Book, rank), ordered by (rank, uid), highest rank first. """
+        if cursor is not None:
+            last_rank, last_uid = decode_rank_cursor(cursor)
+            statement = statement.where(tuple_(rank, Book.uid) < tuple_(last_rank, last_uid))
+
+        statement = statement.options(noload(Book.reviews)).order_by(desc(rank), desc(Book.uid)).limit(limit + 1)
         result = await session.exec(statement)
-        return result.all()
+        rows = result.all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_book, last_rank = rows[-1]
+            next_cursor = encode_rank_cursor(last_rank, last_book.uid)
+
+        return {"items": [book for book, _ in rows], "next_cursor": next_cursor}
+
+
+    async def search_books(self, query: str, session: AsyncSession, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE) -> dict:
+        """ Ranks books whose title, author or publisher match the query, best match first. """
+        search_vector = Book.__table__.c.search_vector
+        ts_query = func.websearch_to_tsquery('english', query)
+        rank = func.ts_rank_cd(search_vector, ts_query).label("rank")
+
+        statement = select(Book, rank).where(search_vector.op('@@')(ts_query))
+        return await self.paginate_ranked(statement, rank, cursor, limit, session)
 
 
     @staticmethod
@@ -34,6 +91,61 @@ class BookService:
         return book if book is not None else None
 
 
+    @staticmethod
+    async def book_exists(book_uid: str, session: AsyncSession) -> bool:
+        """ Checks a book exists without loading it or its reviews. """
+        result = await session.exec(select(Book.uid).where(Book.uid == book_uid))
+        return result.first() is not None
+
+
+    async def get_book_detail(self, book_uid: str, session: AsyncSession, review_limit: Optional[int] = None) -> Optional[BookDetailModel]:
+        """ Read-through cache in front of get_book: serve from Redis, else load and cache the book.
+        With review_limit, only that many of the newest reviews are returned. """
+        cached_book = await get_cached_book(book_uid)
+        if cached_book is not None:
+            if review_limit is not None:
+                newest = sorted(cached_book.reviews, key=lambda review: (review.created_at, review.uid), reverse=True)
+                cached_book.reviews = newest[:review_limit]
+            return cached_book
+
+        if review_limit is not None:
+            return await self.get_book_with_newest_reviews(book_uid, review_limit, session)
+
+        book = await self.get_book(book_uid, session)
+        if book is None:
+            return None
+
+        book_detail = BookDetailModel.model_validate(book)
+        await cache_book(book_detail)
+        return book_detail
+
+
+    @staticmethod
+    async def get_book_with_newest_reviews(book_uid: str, review_limit: int, session: AsyncSession) -> Optional[BookDetailModel]:
+        """ Loads a book and only its newest reviews, not cached since the cache holds every review. """
+        book = (await session.exec(select(Book).where(Book.uid == book_uid).options(noload(Book.reviews)))).first()
+        if book is None:
+            return None
+
+        return await BookService.with_newest_reviews(book, review_limit, session)
+
+
+    @staticmethod
+    async def with_newest_reviews(book: Book, review_limit: int, session: AsyncSession) -> BookDetailModel:
+        """ Builds the book's detail with only its newest review_limit reviews, in one query. """
+        statement = (
+            select(Review)
+            .where(Review.book_uid == book.uid)
+            .order_by(desc(Review.created_at), desc(Review.uid))  # Served by ix_reviews_book_uid_created_at_uid
+            .limit(review_limit)
+        )
+        reviews = (await session.exec(statement)).all()
+
+        book_detail = BookDetailModel.model_validate(book)
+        book_detail.reviews = [ReviewModel.model_validate(review) for review in reviews]
+        return book_detail
+
+
     @staticmethod
     async def get_user_book(book_uid: str, user_uid: str, session: AsyncSession):
         statement = select(Book).where(Book.user_uid == user_uid).where(Book.uid == book_uid)
@@ -45,37 +157,102 @@ class BookService:
     @staticmethod
     async def create_a_book(book_data: BookCreateModel, user_uid: str, session: AsyncSession):
         book_data_dict = book_data.model_dump()  # Convert to dictionary
-        new_book = Book(**book_data_dict, uid=uuid.uuid4(), created_at=datetime.now(), updated_at=datetime.now())
+        new_book = Book(**book_data_dict, uid=uuid.uuid4(), created_at=datetime.now(), updated_at=datetime.now(), reviews=[])  # New books have no reviews to lazy-load
         new_book.user_uid = user_uid
-        new_book.published_date = datetime.strptime(book_data_dict['published_date'], '%Y-%m-%d')
         session.add(new_book)
         await session.commit()
         return new_book
 
 
-    async def update_book(self, book_uid: str, update_data: BookUpdateModel, session: AsyncSession):
-        book_to_update = await self.get_book(book_uid, session)
-        if book_to_update is None:
+    @staticmethod
+    async def update_book(book_uid: str, update_data: BookUpdateModel, session: AsyncSession,
+                          review_limit: int = DEFAULT_PAGE_SIZE) -> Optional[BookDetailModel]:
+        """ Updates the book in two queries: UPDATE ... RETURNING instead of SELECT, UPDATE and refresh,
+        then one SELECT for the newest review_limit reviews the detail response includes. """
+        update_data_dict = update_data.model_dump(exclude_unset=True)  # Exclude unset fields
+
+        statement = (
+            update(Book)
+            .where(Book.uid == book_uid)
+            .values(**update_data_dict, updated_at=datetime.now())
+            .returning(Book)
+            .options(noload(Book.reviews))
+        )
+        result = await session.exec(statement)
+        updated_book = result.scalar_one_or_none()
+        if updated_book is None:
             return None
 
-        update_data_dict = update_data.model_dump(exclude_unset=True)  # Exclude unset fields
+        book_detail = await BookService.with_newest_reviews(updated_book, review_limit, session)
+        await session.commit()
+        await invalidate_book(book_uid)
+        return book_detail
 
-        # Iterate through the update_data_dict and update each field of the book instance
-        for k, v in update_data_dict.items():
-            setattr(book_to_update, k, v)  # Dynamically update the book's attributes with new values
 
-        book_to_update.updated_at = datetime.now()
+    @staticmethod
+    async def delete_book(book_uid: str, session: AsyncSession):
+        # One DELETE ... RETURNING; the database detaches the book's reviews through ON DELETE SET NULL
+        statement = delete(Book).where(Book.uid == book_uid).returning(Book.uid)
+        result = await session.exec(statement)
+        deleted_uid = result.scalar_one_or_none()
+        if deleted_uid is None:
+            return None
 
         await session.commit()
-        await session.refresh(book_to_update)  # Refresh to get updated data
-        return book_to_update
+        await invalidate_book(book_uid)
+        return True
+
+
+    @staticmethod
+    async def record_rating(book_uid: str, rating: int, session: AsyncSession) -> bool:
+        """ Adds one rating to a book's statistics in a single UPDATE, without reading the book first.
+        Runs in the caller's transaction, so the statistics commit together with the review. """
+        rating_count = getattr(Book, f"rating_count_{rating}")
+        statement = (
+            update(Book)
+            .where(Book.uid == book_uid)
+            .values({Book.review_count: Book.review_count + 1, Book.rating_sum: Book.rating_sum + rating, rating_count: rating_count + 1})
+            .execution_options(synchronize_session=False)
+        )
+        result = await session.exec(statement)
+        return result.rowcount == 1
 
 
-    async def delete_book(self, book_uid: str, session: AsyncSession):
-        book_to_delete = await self.get_book(book_uid, session)
-        if book_to_delete is None:
+    @staticmethod
+    async def recompute_rating_stats(after_uid: Optional[uuid.UUID], batch_size: int, session: AsyncSession) -> Optional[uuid.UUID]:
+        """ Recomputes the rating statistics of the next batch of books (by uid) from their reviews, commits and
+        drops those books from the cache. Returns the last uid of the batch to pass back in, or None when every book has been processed. """
+        statement = select(Book.uid).order_by(Book.uid).limit(batch_size).with_for_update()
+        if after_uid is not None:
+            statement = statement.where(Book.uid > after_uid)
+
+        # Locking the books first makes a concurrent add_review either finish before the counts are read or
+        # wait and apply its increment on top of them, so no review is lost or counted twice
+        book_uids = (await session.exec(statement)).all()
+        if not book_uids:
+            await session.commit()
             return None
 
-        await session.delete(book_to_delete)
+        stats = (
+            select(
+                Review.book_uid,
+                func.count().label("review_count"),
+                func.sum(Review.rating).label("rating_sum"),
+                *[func.count().filter(Review.rating == rating).label(f"rating_count_{rating}") for rating in RATINGS],
+            )
+            .where(Review.book_uid.in_(book_uids))
+            .group_by(Review.book_uid)
+            .subquery()
+        )
+        columns = ["review_count", "rating_sum"] + [f"rating_count_{rating}" for rating in RATINGS]
+        await session.exec(
+            update(Book)
+            .where(Book.uid.in_(book_uids))
+            .values({column: func.coalesce(select(stats.c[column]).where(stats.c.book_uid == Book.uid).scalar_subquery(), 0) for column in columns})
+            .execution_options(synchronize_session=False)
+        )
         await session.commit()
-        return True
\ No newline at end of file
+
+        # Cached details still hold the old statistics
+        await asyncio.gather(*(invalidate_book(book_uid) for book_uid in book_uids))
+        return book_uids[-1]
@@ -1,6 +1,7 @@
 import uuid
 from datetime import datetime
 import sqlalchemy.dialects.postgresql as pg
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Column, Relationship
 from typing import Optional
 
@@ -9,21 +10,25 @@ from api.v1.auth import models
 
 class Review(SQLModel, table=True):
     __tablename__ = "reviews"
+    __table_args__ = (
+        Index("ix_reviews_book_uid_created_at_uid", "book_uid", "created_at", "uid"),  # A book's reviews, newest first
+        Index("ix_reviews_book_uid_rating_uid", "book_uid", "rating", "uid"),  # A book's reviews, best rated first
+    )
 
     uid: uuid.UUID = Field(
         sa_column=Column(
             pg.UUID,
             nullable=False,
             primary_key=True,
-            default=uuid.uuid4()
+            default=uuid.uuid4
         )
     )
     rating: int = Field(lt=5)
     review_text: str
-    user_uid: Optional[uuid.UUID] = Field(default=None, foreign_key="users.uid")
-    book_uid: Optional[uuid.UUID] = Field(default=None, foreign_key="books.uid")
-    created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now()))
-    updated_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now()))
+    user_uid: Optional[uuid.UUID] = Field(default=None, foreign_key="users.uid", index=True)
+    book_uid: Optional[uuid.UUID] = Field(default=None, foreign_key="books.uid", ondelete="SET NULL")
+    created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
+    updated_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
     user: Optional["models.User"] = Relationship(back_populates="reviews")
     book: Optional["models.Book"] = Relationship(back_populates="reviews")
 
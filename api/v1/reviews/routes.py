@@ -1,11 +1,14 @@
-from fastapi import status, APIRouter, Depends
+from typing import Literal, Optional
+
+from fastapi import status, APIRouter, Depends, Query
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from api.v1.auth.dependency import AccessTokenBearer, CheckRole
 from api.v1.reviews.models import Review
-from api.v1.reviews.schema import ReviewCreateModel
+from api.v1.reviews.schema import ReviewCreateModel, ReviewPageModel
 from api.v1.reviews.service import ReviewService
-from db.db import get_session
+from db.db import get_session, get_read_session
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 
 access_token_bearer = AccessTokenBearer()
@@ -17,6 +20,13 @@ review_service = ReviewService()
 
 @review_router.post('/book/{book_uid}', status_code=status.HTTP_201_CREATED, response_model=Review, dependencies=[role_checker])
 async def add_review_to_books(book_uid: str, review_data: ReviewCreateModel, session: AsyncSession = Depends(get_session), token_details=Depends(access_token_bearer)) -> Review:
-    user_email = token_details['user']['email']
-    new_review = await review_service.add_review_to_book(user_email=user_email, book_uid=book_uid, review_data=review_data, session=session)
-    return new_review
\ No newline at end of file
+    user_uid = token_details['user']['user_uid']
+    new_review = await review_service.add_review_to_book(user_uid=user_uid, book_uid=book_uid, review_data=review_data, session=session)
+    return new_review
+
+
+# GET a book's reviews one page at a time, newest first or best rated first
+@review_router.get('/book/{book_uid}', response_model=ReviewPageModel, dependencies=[role_checker])
+async def get_book_reviews(book_uid: str, cursor: Optional[str] = None, limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), sort: Literal["newest", "rating"] = "newest", session: AsyncSession = Depends(get_read_session), token_details=Depends(access_token_bearer)):
+    reviews = await review_service.get_book_reviews(book_uid, session, cursor, limit, sort)
+    return reviews
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -14,12 +14,20 @@ class ReviewModel(BaseModel):
     created_at: datetime
     updated_at: datetime
 
+    class Config:
+        from_attributes = True  # Enables ORM mode for Pydantic v2
+
+
+class ReviewPageModel(BaseModel):
+    items: List[ReviewModel]
+    next_cursor: Optional[str] = None  # Pass back as ?cursor= to fetch the next page, None on the last page
+
 
 class ReviewCreateModel(BaseModel):
-    rating: int = Field(lt=5)
+    rating: int = Field(ge=0, lt=5)  # One of api.v1.books.models.RATINGS
     review_text: str
 
 
 class ReviewUpdateModel(BaseModel):
-    rating: int = Field(lt=5)
+    rating: int = Field(ge=0, lt=5)
     review_text: str
\ No newline at end of file
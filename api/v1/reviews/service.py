@@ -1,37 +1,87 @@
+import uuid
+from datetime import datetime
+from typing import Optional
+
 from fastapi import HTTPException, status
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlmodel import desc, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from errors import BookNotFound
+from pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor, decode_rating_cursor, encode_rating_cursor
+
 from .models import Review
 from .schema import ReviewCreateModel
-from ..auth.service import UserService
+from ..books.cache import invalidate_book
 from ..books.service import BookService
 
-user_service = UserService()
 book_service = BookService()
 
 
 class ReviewService:
 
     @staticmethod
-    async def add_review_to_book(user_email: str, book_uid: str, review_data: ReviewCreateModel, session: AsyncSession) -> Review:
-        user = await user_service.get_user_by_email(email=user_email, session=session)
-        if not user:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-
-        book = await book_service.get_book(book_uid=book_uid, session=session)
-        if not book:
+    async def add_review_to_book(user_uid: str, book_uid: str, review_data: ReviewCreateModel, session: AsyncSession) -> Review:
+        """ Adds a review in a fixed number of round trips, however many books and reviews the user or book has:
+        the rating stats UPDATE doubles as the book existence check and the user foreign key guards the insert. """
+        try:
+            book_uid = uuid.UUID(str(book_uid))
+        except ValueError:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
 
         try:
-            new_review = Review(**review_data.model_dump(), user=user, book=book)
+            # Updating the stats first also locks the book row, so the book cannot be deleted before the insert
+            if not await book_service.record_rating(book_uid, review_data.rating, session):
+                await session.rollback()
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
 
+            now = datetime.now()
+            new_review = Review(**review_data.model_dump(), uid=uuid.uuid4(), user_uid=uuid.UUID(str(user_uid)), book_uid=book_uid, created_at=now, updated_at=now)
             session.add(new_review)
             await session.commit()
-            await session.refresh(new_review)
 
-            return new_review
+        except IntegrityError:
+            await session.rollback()
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
         except SQLAlchemyError:
             await session.rollback()
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An error occurred while adding the review.")
\ No newline at end of file
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An error occurred while adding the review.")
+
+        await invalidate_book(book_uid)  # The cached book detail embeds its reviews
+        return new_review
+
+
+    @staticmethod
+    async def get_book_reviews(book_uid: str, session: AsyncSession, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE, sort: str = "newest") -> dict:
+        """ One keyset page of a book's reviews, newest first or best rated first. """
+        statement = select(Review).where(Review.book_uid == book_uid)
+
+        if sort == "rating":
+            # Served by ix_reviews_book_uid_rating_uid
+            if cursor is not None:
+                rating, uid = decode_rating_cursor(cursor)
+                statement = statement.where(tuple_(Review.rating, Review.uid) < tuple_(rating, uid))
+            statement = statement.order_by(desc(Review.rating), desc(Review.uid))
+        else:
+            # Served by ix_reviews_book_uid_created_at_uid
+            if cursor is not None:
+                created_at, uid = decode_cursor(cursor)
+                statement = statement.where(tuple_(Review.created_at, Review.uid) < tuple_(created_at, uid))
+            statement = statement.order_by(desc(Review.created_at), desc(Review.uid))
+
+        result = await session.exec(statement.limit(limit + 1))
+        reviews = result.all()
+
+        # An empty first page is either a book without reviews or a book that does not exist
+        if not reviews and cursor is None and not await book_service.book_exists(book_uid, session):
+            raise BookNotFound()
+
+        next_cursor = None
+        if len(reviews) > limit:
+            reviews = reviews[:limit]
+            last = reviews[-1]
+            next_cursor = encode_rating_cursor(last.rating, last.uid) if sort == "rating" else encode_cursor(last.created_at, last.uid)
+
+        return {"items": reviews, "next_cursor": next_cursor}
@@ -1,19 +1,25 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 
+from api.v1.admin.routes import admin_router
 from api.v1.auth.routes import auth_router
 from api.v1.books.routes import book_router
 from api.v1.reviews.routes import review_router
 from db.db import init_db
+from db.redis import revoked_jti_filter
 from errors import register_all_errors
+from metrics import render_metrics
 from middleware import register_middleware
 
 
 @asynccontextmanager
-async def life_span():
+async def life_span(app: FastAPI):
     print('Server is starting ...')
-    await init_db()
+    # Tables are created by the Alembic migrations, run `await init_db()` here only for a throwaway database
+    await revoked_jti_filter.start()
     yield
+    await revoked_jti_filter.stop()
     print('Server has been stopped.')
 
 
@@ -23,12 +29,13 @@ app = FastAPI(
     title="FastAPI Course",
     description="A REST API for a book review web service",
     version=version,
-    # lifespan=life_span
+    lifespan=life_span
 )
 
 app.include_router(book_router, prefix=f'/api/{version}/books', tags=['books'])
 app.include_router(auth_router, prefix=f'/api/{version}/auth', tags=['users'])
 app.include_router(review_router, prefix=f'/api/{version}/reviews', tags=['reviews'])
+app.include_router(admin_router, prefix=f'/api/{version}/admin', tags=['admin'])
 
 register_all_errors(app)
 register_middleware(app)
@@ -36,4 +43,9 @@ register_middleware(app)
 
 @app.get('/')
 def server_health():
-    return "server is active..."
\ No newline at end of file
+    return "server is active..."
+
+
+@app.get('/metrics', response_class=PlainTextResponse, include_in_schema=False)
+def metrics():
+    return render_metrics()
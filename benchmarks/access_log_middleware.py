@@ -0,0 +1,86 @@
+"""
+Requests per second through a minimal app wrapped in the previous print-based
+@app.middleware('http') timing middleware and in the pure ASGI
+AccessLogMiddleware. Both write to /dev/null so only the middleware cost differs.
+
+Run from the project root:
+
+    python -m benchmarks.access_log_middleware --requests 5000
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import time
+
+import httpx
+from fastapi import FastAPI
+from fastapi.requests import Request
+
+from middleware import AccessLogMiddleware, start_access_log_listener
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get('/')
+    async def server_health():
+        return "server is active..."
+
+    return app
+
+
+def with_print_middleware() -> FastAPI:
+    app = build_app()
+
+    @app.middleware('http')
+    async def custom_logging(request: Request, call_next):
+        start_time = time.time()
+        print(f"--- Request Start ---\nTime: {start_time}\nPath: {request.url.path}")
+        response = await call_next(request)
+        end_time = time.time()
+        duration = round(end_time - start_time, 4)
+        print(f"--- Request End ---\nTime: {end_time}\nDuration: {duration} seconds\nPath: {request.url.path}")
+        return response
+
+    return app
+
+
+def with_asgi_middleware(sample_rate: float) -> FastAPI:
+    app = build_app()
+    app.add_middleware(AccessLogMiddleware, sample_rate=sample_rate)
+    return app
+
+
+async def requests_per_second(app: FastAPI, requests: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as client:
+        await client.get('/')  # Warm up routing and middleware stack
+
+        start = time.perf_counter()
+        for _ in range(requests):
+            await client.get('/')
+        return requests / (time.perf_counter() - start)
+
+
+async def main(requests: int) -> None:
+    devnull = open(os.devnull, "w")
+    start_access_log_listener(logging.StreamHandler(devnull))
+
+    with contextlib.redirect_stdout(devnull):
+        results = {
+            "before (print, BaseHTTPMiddleware)": await requests_per_second(with_print_middleware(), requests),
+            "after (ASGI, queued log)": await requests_per_second(with_asgi_middleware(1.0), requests),
+            "after (ASGI, 10% sampled)": await requests_per_second(with_asgi_middleware(0.1), requests),
+        }
+
+    for name, rps in results.items():
+        print(f"{name:<36} {rps:8.0f} req/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000, help="sequential requests per variant")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
@@ -0,0 +1,112 @@
+"""
+Query plans and latency of the hot lookups (user by email, one user's book page,
+a book's review page, a user's reviews) without and with the lookup indexes
+added in migrations b3e1f7c2a9d4 and 5a0d93be7c16. Data is seeded into a scratch
+schema on the Postgres database in DATABASE_URL and the schema is dropped
+afterwards; the real tables are never touched.
+
+Run from the project root:
+
+    python -m benchmarks.lookup_indexes --users 20000 --books-per-user 5 --reviews-per-book 4
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+from sqlmodel import SQLModel
+
+from api.v1.auth.models import User  # Loads every model in a cycle-safe order
+from db.db import engine
+
+SCHEMA = "index_benchmark"
+LOOKUP_INDEXES = ["ix_users_email", "ix_books_user_uid_created_at_uid", "ix_reviews_book_uid_created_at_uid", "ix_reviews_user_uid"]
+
+QUERIES = {
+    "user by email": "SELECT * FROM users WHERE email = :email",
+    "user's book page": "SELECT * FROM books WHERE user_uid = :user_uid ORDER BY created_at DESC, uid DESC LIMIT 21",
+    "book's reviews": "SELECT * FROM reviews WHERE book_uid = :book_uid ORDER BY created_at DESC, uid DESC LIMIT 21",
+    "user's reviews": "SELECT * FROM reviews WHERE user_uid = :user_uid",
+}
+
+SEED = [
+    """INSERT INTO users (uid, username, email, first_name, last_name, role, is_verified, password_hash, created_at, updated_at)
+       SELECT gen_random_uuid(), 'user' || n, 'user' || n || '@example.com', 'first', 'last', 'user', true, 'x', now(), now()
+       FROM generate_series(1, :users) AS n""",
+    """INSERT INTO books (uid, title, author, publisher, published_date, page_count, language, user_uid, created_at, updated_at)
+       SELECT gen_random_uuid(), 'title ' || n, 'author', 'publisher', current_date, 200, 'English', users.uid,
+              now() - n * interval '1 minute', now()
+       FROM users, generate_series(1, :books_per_user) AS n""",
+    """INSERT INTO reviews (uid, rating, review_text, user_uid, book_uid, created_at, updated_at)
+       SELECT gen_random_uuid(), 3, 'review', books.user_uid, books.uid, now(), now()
+       FROM books, generate_series(1, :reviews_per_book) AS n""",
+]
+
+
+async def time_queries(conn, params: dict, repeats: int) -> dict:
+    results = {}
+    for name, sql in QUERIES.items():
+        plan = (await conn.execute(text(f"EXPLAIN ANALYZE {sql}"), params)).scalars().all()
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            (await conn.execute(text(sql), params)).all()
+        results[name] = (plan[0], (time.perf_counter() - start) / repeats * 1000)
+
+    return results
+
+
+async def main(users: int, books_per_user: int, reviews_per_book: int, repeats: int) -> None:
+    async with engine.connect() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        await conn.commit()
+
+        try:
+            schema_conn = await conn.execution_options(schema_translate_map={None: SCHEMA})
+            await schema_conn.run_sync(SQLModel.metadata.create_all)
+            await conn.execute(text(f"SET search_path TO {SCHEMA}"))
+
+            seed_params = {"users": users, "books_per_user": books_per_user, "reviews_per_book": reviews_per_book}
+            for sql in SEED:
+                await conn.execute(text(sql), seed_params)
+            for index in LOOKUP_INDEXES:
+                await conn.execute(text(f"DROP INDEX {index}"))
+            await conn.execute(text("ANALYZE"))
+            await conn.commit()
+
+            row = (await conn.execute(text("SELECT email, uid FROM users ORDER BY random() LIMIT 1"))).one()
+            book_uid = (await conn.execute(text("SELECT uid FROM books WHERE user_uid = :uid LIMIT 1"), {"uid": row.uid})).scalar_one()
+            params = {"email": row.email, "user_uid": row.uid, "book_uid": book_uid}
+
+            before = await time_queries(conn, params, repeats)
+
+            for table in SQLModel.metadata.sorted_tables:
+                for index in table.indexes:
+                    if index.name in LOOKUP_INDEXES:
+                        await schema_conn.run_sync(index.create)
+            await conn.execute(text("ANALYZE"))
+            await conn.commit()
+
+            after = await time_queries(conn, params, repeats)
+        finally:
+            await conn.rollback()
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.commit()
+
+    await engine.dispose()
+
+    for name in QUERIES:
+        print(f"{name}:")
+        print(f"  before {before[name][1]:8.3f} ms  {before[name][0]}")
+        print(f"  after  {after[name][1]:8.3f} ms  {after[name][0]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000, help="users seeded")
+    parser.add_argument("--books-per-user", type=int, default=5, help="books seeded per user")
+    parser.add_argument("--reviews-per-book", type=int, default=4, help="reviews seeded per book")
+    parser.add_argument("--repeats", type=int, default=200, help="timed runs per query")
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.books_per_user, args.reviews_per_book, args.repeats))
@@ -0,0 +1,73 @@
+"""
+Event-loop latency seen by other routes during a login storm, with bcrypt
+verification run inline on the event loop (before) and on the password hashing
+pool (after).
+
+Run from the project root:
+
+    python -m benchmarks.password_hashing --logins 32
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from api.v1.auth.utils import generate_password_hash, verify_password, verify_password_async
+from errors import PasswordHashingBusy
+
+PROBE_INTERVAL = 0.005
+
+
+async def probe_event_loop(stop: asyncio.Event, lags: list) -> None:
+    """ Stands in for other routes: measures how late a 5 ms sleep wakes up. """
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+async def inline_login(password: str, hashed_password: str) -> bool:
+    return verify_password(password, hashed_password)
+
+
+async def pooled_login(password: str, hashed_password: str) -> bool:
+    return await verify_password_async(password, hashed_password)
+
+
+async def login_storm(login, logins: int, hashed_password: str) -> dict:
+    stop = asyncio.Event()
+    lags = []
+    probe = asyncio.create_task(probe_event_loop(stop, lags))
+    await asyncio.sleep(PROBE_INTERVAL * 2)  # Let the probe take a baseline sample
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(login("password123", hashed_password) for _ in range(logins)), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await probe
+
+    lags_ms = sorted(lag * 1000 for lag in lags)
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "rejected": sum(isinstance(r, PasswordHashingBusy) for r in results),
+        "lag_p50_ms": round(statistics.median(lags_ms), 2),
+        "lag_p99_ms": round(lags_ms[int(len(lags_ms) * 0.99) - 1] if len(lags_ms) > 1 else lags_ms[-1], 2),
+        "lag_max_ms": round(lags_ms[-1], 2),
+        "probe_samples": len(lags_ms),
+    }
+
+
+async def main(logins: int) -> None:
+    hashed_password = generate_password_hash("password123")
+
+    for name, login in (("before (inline bcrypt)", inline_login), ("after (hashing pool)", pooled_login)):
+        result = await login_storm(login, logins, hashed_password)
+        print(f"{name:<24} {result}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=32, help="concurrent login attempts in the storm")
+    args = parser.parse_args()
+    asyncio.run(main(args.logins))
@@ -0,0 +1,78 @@
+"""
+Emails per second from the Celery worker's send path against a local aiosmtpd
+sink: a new FastMail connection per message (the previous behaviour) vs the
+pooled connections of SMTPConnectionPool. The sink is plaintext without login,
+so against a real server, where each new connection also pays for the TLS
+handshake and AUTH round trips over the network, the gap is wider.
+
+Needs aiosmtpd (pip install aiosmtpd). Run from the project root:
+
+    python -m benchmarks.smtp_pool --messages 500
+"""
+import argparse
+import asyncio
+import time
+
+from aiosmtpd.controller import Controller
+from fastapi_mail import ConnectionConfig, FastMail
+
+from mail import SMTPConnectionPool, create_message
+
+
+class Sink:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+
+def sink_config(port: int) -> ConnectionConfig:
+    return ConnectionConfig(
+        MAIL_USERNAME="",
+        MAIL_PASSWORD="",
+        MAIL_PORT=port,
+        MAIL_SERVER="127.0.0.1",
+        MAIL_FROM="bench@example.com",
+        MAIL_FROM_NAME="Bookly benchmark",
+        MAIL_STARTTLS=False,
+        MAIL_SSL_TLS=False,
+        USE_CREDENTIALS=False,
+        VALIDATE_CERTS=False,
+    )
+
+
+async def send_all(send, messages: int) -> float:
+    start = time.perf_counter()
+    for n in range(messages):
+        await send(create_message(recipients=["reader@example.com"], subject=f"Message {n}", body="<p>Hello</p>"))
+    return messages / (time.perf_counter() - start)
+
+
+async def main(messages: int, port: int) -> None:
+    sink = Sink()
+    controller = Controller(sink, hostname="127.0.0.1", port=port)
+    controller.start()
+
+    try:
+        config = sink_config(port)
+        fresh = await send_all(lambda message: FastMail(config).send_message(message), messages)
+
+        pool = SMTPConnectionPool(config, size=1, max_idle=60)
+        pooled = await send_all(pool.send, messages)
+        await pool.close()
+    finally:
+        controller.stop()
+
+    print(f"{'connection per message':<24} {fresh:8.0f} emails/s")
+    print(f"{'pooled connection':<24} {pooled:8.0f} emails/s  ({pool.stats['connects']} connect)")
+    print(f"sink received {sink.received} of {2 * messages}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500, help="emails sent per variant")
+    parser.add_argument("--port", type=int, default=8025, help="port for the local SMTP sink")
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.port))
@@ -1,5 +1,8 @@
 from celery import Celery
+from celery.signals import after_task_publish
+
 from config import Config
+from metrics import celery_tasks_enqueued_total
 
 celery_app = Celery(
     "worker",
@@ -18,4 +21,17 @@ celery_app.conf.update(
     imports=[
         "api.v1.auth.celery_send_email"  # The module with your @celery_app.task
     ],
-)
\ No newline at end of file
+    beat_schedule={
+        "dispatch-email-outbox": {
+            "task": "api.v1.auth.celery_send_email.dispatch_email_outbox",
+            "schedule": Config.MAIL_OUTBOX_INTERVAL,
+            "options": {"expires": Config.MAIL_OUTBOX_INTERVAL},  # Runs missed while workers were down are not replayed
+        },
+    },
+)
+
+
+@after_task_publish.connect
+def count_enqueued_task(sender=None, **kwargs):
+    """Counts every task the API publishes, e.g. send_email.delay, for /metrics"""
+    celery_tasks_enqueued_total.inc(sender)
@@ -0,0 +1,41 @@
+"""
+Recomputes review_count, rating_sum and the rating histogram of every book from
+its reviews. Run once after the rating stats migration, and again whenever the
+statistics are suspected to have drifted. Books are processed in uid order, one
+short transaction per batch, so the API keeps serving while it runs. Each batch's
+books are dropped from the book cache once it commits.
+
+Run from the project root:
+
+    python -m commands.backfill_rating_stats --batch-size 500
+"""
+import argparse
+import asyncio
+
+from api.v1.auth.models import User  # Loads every model in a cycle-safe order
+from api.v1.books.cache import drain_delayed_deletes
+from api.v1.books.service import BookService
+from db.db import async_session, engine
+
+
+async def main(batch_size: int) -> None:
+    batches = 0
+    last_uid = None
+
+    async with async_session() as session:
+        while True:
+            last_uid = await BookService.recompute_rating_stats(last_uid, batch_size, session)
+            if last_uid is None:
+                break
+            batches += 1
+
+    await drain_delayed_deletes()
+    await engine.dispose()
+    print(f"Recomputed rating stats in {batches} batches of up to {batch_size} books")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500, help="books locked and updated per transaction")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size))
@@ -0,0 +1,42 @@
+"""
+Sends the emails waiting in the email outbox, for deployments that run no
+celery beat or that need to drain a backlog by hand. Rows are locked with
+SKIP LOCKED, so it is safe to run next to the beat-driven dispatcher and
+next to other copies of itself.
+
+Run from the project root:
+
+    python -m commands.dispatch_email_outbox --once
+    python -m commands.dispatch_email_outbox --interval 5
+"""
+import argparse
+import asyncio
+
+from api.v1.auth.models import User  # Loads every model in a cycle-safe order
+from api.v1.auth.outbox import dispatch_outbox
+from config import Config
+from db.db import async_session, engine
+from mail import smtp_pool
+
+
+async def main(batch_size: int, interval: float, once: bool) -> None:
+    try:
+        while True:
+            stats = await dispatch_outbox(async_session, smtp_pool.send_batch, batch_size)
+            if stats["sent"] or stats["failed"]:
+                print(f"Sent {stats['sent']} emails, {stats['failed']} failed and were rescheduled")
+            if once:
+                break
+            await asyncio.sleep(interval)
+    finally:
+        await smtp_pool.close()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=Config.MAIL_OUTBOX_BATCH_SIZE, help="emails locked and sent per transaction")
+    parser.add_argument("--interval", type=float, default=Config.MAIL_OUTBOX_INTERVAL, help="seconds between drains")
+    parser.add_argument("--once", action="store_true", help="drain the outbox once and exit")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.interval, args.once))
@@ -3,6 +3,22 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    DB_ECHO: bool = False  # Log every SQL statement, for local debugging only
+    DB_POOL_SIZE: int = 5  # Connections kept open per worker process
+    DB_MAX_OVERFLOW: int = 10  # Extra connections allowed under load, closed when returned
+    DB_POOL_TIMEOUT: int = 30  # Seconds to wait for a free connection before failing
+    DB_POOL_RECYCLE: int = 1800  # Seconds after which a connection is replaced, -1 to disable
+    DB_POOL_PRE_PING: bool = True  # Check a connection is alive before handing it out
+    DB_STATEMENT_TIMEOUT_MS: int = 0  # Postgres statement_timeout for every connection, 0 to disable
+    DB_QUERY_BUDGET: int = 10  # Queries one request may run before it is logged as over budget
+    DB_N_PLUS_ONE_THRESHOLD: int = 5  # Times one statement may repeat in a request before it is logged as a likely N+1
+    DB_SLOW_QUERY_MS: float = 500  # Queries slower than this are logged to the slow query log, 0 to disable
+    DB_SLOW_QUERY_LOG_SIZE: int = 100  # Slow queries kept per worker process, oldest dropped first
+    DB_SLOW_QUERY_EXPLAIN_RATE: float = 0.1  # Fraction of slow SELECTs re-run under EXPLAIN (ANALYZE, BUFFERS)
+    DB_SLOW_QUERY_MAX_EXPLAINS: int = 1  # EXPLAIN runs allowed at once, each holds a pooled connection
+    DATABASE_REPLICA_URLS: str = ""  # Comma-separated read replica URLs, empty to send reads to the primary
+    DB_REPLICA_BALANCING: str = "round_robin"  # "round_robin" or "least_connections"
+    DB_REPLICA_LAG_WINDOW: int = 5  # Seconds a client reads from the primary after it writes
     JWT_SECRET: str
     JWT_ALGORITHM: str
     REDIS_HOST: str = "localhost"
@@ -17,9 +33,37 @@ class Settings(BaseSettings):
     MAIL_SSL_TLS: bool = False
     USE_CREDENTIALS: bool = True
     VALIDATE_CERTS: bool = True
+    MAIL_POOL_SIZE: int = 2  # SMTP connections each worker process keeps open
+    MAIL_POOL_MAX_IDLE: int = 60  # Seconds a pooled SMTP connection may sit unused before a NOOP health check
+    MAIL_BULK_BATCH_SIZE: int = 100  # Recipients a bulk email job sends over one SMTP session before reporting progress
+    MAIL_OUTBOX_BATCH_SIZE: int = 100  # Outbox rows locked and sent per dispatcher transaction
+    MAIL_OUTBOX_INTERVAL: float = 5  # Seconds between outbox dispatcher runs
+    MAIL_OUTBOX_MAX_ATTEMPTS: int = 8  # Failed sends before an outbox email is left for inspection
+    MAIL_OUTBOX_RETRY_DELAY: int = 30  # Seconds before the first retry of a failed outbox email, doubled after each failure
     DOMAIN_NAME: str
     CELERY_BROKER_URL: str = "redis://localhost:6379/0"
     CELERY_RESULT_BACKEND: str = "redis://localhost:6379/0"
+    ACCESS_LOG_SAMPLE_RATE: float = 1.0  # Fraction of requests written to the access log
+    BOOK_CACHE_TTL: int = 300  # Seconds a cached book detail lives in Redis before it is reloaded
+    BOOK_IMPORT_BATCH_SIZE: int = 5000  # Rows validated and copied to the database together by the bulk import
+    BOOK_IMPORT_MAX_ERRORS: int = 100  # Rejected rows listed in a bulk import response, the rest are only counted
+    BOOK_IMPORT_MAX_RECORD_LINES: int = 100  # Lines one CSV record may span before it is rejected as an unbalanced quote
+    BOOK_IMPORT_MAX_RECORD_BYTES: int = 64 * 1024  # Characters one CSV record may hold before it is rejected likewise
+    BOOK_EXPORT_CHUNK_SIZE: int = 1000  # Rows fetched from the server-side cursor and sent per chunk by the export
+    PRINCIPAL_CACHE_TTL: int = 30  # Seconds a worker trusts its cached role/verification state for a user
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    JTI_FILTER_CAPACITY: int = 100000  # Revocations expected per JTI expiry window, sizes the local Bloom filter
+    JTI_FILTER_ERROR_RATE: float = 0.001
+    VERIFIED_TOKEN_CACHE_SIZE: int = 10000  # Verified JWTs remembered per worker so repeat requests skip the signature check
+    PASSWORD_HASH_WORKERS: int = 4  # Threads running bcrypt off the event loop
+    PASSWORD_HASH_MAX_PENDING: int = 32  # Hash/verify calls allowed in flight before new ones are rejected with 503
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_LOCAL_KEYS: int = 10000  # Exhausted buckets each worker remembers, so repeat requests are refused without Redis
+    RATE_LIMIT_LOGIN_PER_IP: str = "20/minute"
+    RATE_LIMIT_LOGIN_PER_ACCOUNT: str = "5/minute"  # Each attempt costs a user lookup and a bcrypt verify
+    RATE_LIMIT_SIGNUP_PER_IP: str = "5/minute"
+    RATE_LIMIT_PASSWORD_RESET_PER_IP: str = "5/minute"
+    RATE_LIMIT_PASSWORD_RESET_PER_ACCOUNT: str = "3/hour"  # Each request sends an email
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -1,29 +1,207 @@
-from sqlalchemy.ext.asyncio import create_async_engine
+import functools
+import itertools
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.requests import Request
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlmodel import SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.orm import sessionmaker
 
 from config import Config
+from db.slow_queries import record_slow_query
+from metrics import db_pool_checkouts_total, db_pool_checkout_wait_seconds, register_collector
 
-# Creates an asynchronous database engine using the provided database URL, with SQL statement logging enabled.
-engine = create_async_engine(
-    url=Config.DATABASE_URL,
-    echo=True
-)
 
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waits for a connection, labelled with its engine's name"""
 
-async def init_db():
-    async with engine.begin() as conn:  # Open an async database connection
+    engine_name = "primary"
 
-        await conn.run_sync(SQLModel.metadata.create_all)  # Create all database tables based on defined models
+    def _do_get(self):
+        start_time = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_checkouts_total.inc(self.engine_name)
+            db_pool_checkout_wait_seconds.observe(time.perf_counter() - start_time, self.engine_name)
 
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool, which must keep reporting under the same engine
+        pool = super().recreate()
+        pool.engine_name = self.engine_name
+        return pool
 
-async def get_session() -> AsyncSession:
-    async_session = sessionmaker(
-        bind=engine,
+
+class QueryStats:
+    """Queries run and time spent in the database while handling one request"""
+
+    __slots__ = ("count", "duration", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()  # SQL text -> times run, a statement repeated many times is usually an N+1
+
+
+# Set by QueryCounterMiddleware for the duration of each request
+request_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("request_query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's execution context, so a statement that fails (and gets no after event)
+    # leaves nothing behind on the pooled connection for a later statement to pick up
+    start_time = time.perf_counter()
+    if context is not None:
+        context.query_start_time = start_time
+    else:
+        conn.info["query_start_time"] = start_time
+
+
+def _after_cursor_execute(async_engine, conn, cursor, statement, parameters, context, executemany):
+    start_time = getattr(context, "query_start_time", None) if context is not None else conn.info.pop("query_start_time", None)
+    if start_time is None:
+        return
+    duration = time.perf_counter() - start_time
+    stats = request_query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += duration
+        stats.statements[statement] += 1
+
+    slow_query_ms = Config.DB_SLOW_QUERY_MS
+    if 0 < slow_query_ms <= duration * 1000 and not statement.startswith("EXPLAIN"):
+        record_slow_query(async_engine, statement, parameters, duration)
+
+
+def instrument_engine(async_engine: AsyncEngine) -> None:
+    """ Counts the queries and database time of each request on this engine and logs slow queries. """
+    event.listen(async_engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(async_engine.sync_engine, "after_cursor_execute", functools.partial(_after_cursor_execute, async_engine))
+
+
+def create_engine(url: str, name: str = "primary") -> AsyncEngine:
+    """ Creates an async engine with the pool settings from Config; its pool metrics are labelled with name. """
+    connect_args = {}
+    if url.startswith("postgresql+asyncpg") and Config.DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["server_settings"] = {"statement_timeout": str(Config.DB_STATEMENT_TIMEOUT_MS)}
+
+    async_engine = create_async_engine(
+        url=url,
+        echo=Config.DB_ECHO,
+        poolclass=InstrumentedPool,
+        pool_size=Config.DB_POOL_SIZE,
+        max_overflow=Config.DB_MAX_OVERFLOW,
+        pool_timeout=Config.DB_POOL_TIMEOUT,
+        pool_recycle=Config.DB_POOL_RECYCLE,
+        pool_pre_ping=Config.DB_POOL_PRE_PING,
+        connect_args=connect_args
+    )
+    async_engine.pool.engine_name = name
+    instrument_engine(async_engine)
+    return async_engine
+
+
+# Creates an asynchronous database engine using the provided database URL
+engine = create_engine(Config.DATABASE_URL)
+
+
+def make_session_factory(bind: AsyncEngine) -> sessionmaker:
+    return sessionmaker(
+        bind=bind,
         class_=AsyncSession,
         expire_on_commit=False
     )
 
+
+# Built once per process and shared by every request
+async_session = make_session_factory(engine)
+
+# Optional read replicas, used only by read-only handlers through get_read_session
+replica_urls = [url.strip() for url in Config.DATABASE_REPLICA_URLS.split(',') if url.strip()]
+replica_engines = [create_engine(url, f"replica{i}") for i, url in enumerate(replica_urls)]
+replica_sessions = [make_session_factory(replica_engine) for replica_engine in replica_engines]
+_replica_counter = itertools.count()
+
+# Set on responses to writes; while it is in the future the client's reads go to the primary
+READ_PRIMARY_COOKIE = "read_primary_until"
+READ_PRIMARY_HEADER = "x-read-primary-until"
+
+
+def get_pool_stats(pool=None) -> dict:
+    """ Returns the current state of a connection pool and the checkout counters recorded so far for it. """
+    pool = pool if pool is not None else engine.pool
+    wait_counts, wait_seconds = db_pool_checkout_wait_seconds.values.get((getattr(pool, "engine_name", None),), ([], 0.0))
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(0, pool.overflow()),  # SQLAlchemy reports a negative count until the pool is full
+        "checkouts": int(sum(wait_counts)),
+        "checkout_wait_seconds": wait_seconds,
+    }
+
+
+def collect_pool_metrics() -> list:
+    pools = [engine.pool] + [replica_engine.pool for replica_engine in replica_engines]
+    lines = ["# TYPE db_pool_checked_out gauge", "# TYPE db_pool_overflow gauge", "# TYPE db_pool_size gauge"]
+    for pool in pools:
+        name = pool.engine_name
+        stats = get_pool_stats(pool)
+        lines.append(f'db_pool_checked_out{{engine="{name}"}} {stats["checked_out"]}')
+        lines.append(f'db_pool_overflow{{engine="{name}"}} {stats["overflow"]}')
+        lines.append(f'db_pool_size{{engine="{name}"}} {stats["size"]}')
+    return lines
+
+
+register_collector(collect_pool_metrics)
+
+
+async def init_db():
+    async with engine.begin() as conn:  # Open an async database connection
+
+        await conn.run_sync(SQLModel.metadata.create_all)  # Create all database tables based on defined models
+
+
+async def get_session() -> AsyncSession:
     async with async_session() as session:
-        yield session  # Provide the session to be used in dependency injection
\ No newline at end of file
+        yield session  # Provide the session to be used in dependency injection
+
+
+def choose_replica() -> Optional[sessionmaker]:
+    """ Picks a replica session factory according to DB_REPLICA_BALANCING, or None without replicas. """
+    if not replica_sessions:
+        return None
+
+    if Config.DB_REPLICA_BALANCING == "least_connections":
+        index = min(range(len(replica_engines)), key=lambda i: replica_engines[i].pool.checkedout())
+    else:
+        index = next(_replica_counter) % len(replica_sessions)
+
+    return replica_sessions[index]
+
+
+def reads_from_primary(request: Request) -> bool:
+    """ True while the client is inside the read-your-own-writes window of its last write. """
+    read_primary_until = request.headers.get(READ_PRIMARY_HEADER) or request.cookies.get(READ_PRIMARY_COOKIE)
+    try:
+        return read_primary_until is not None and float(read_primary_until) > time.time()
+    except ValueError:
+        return False
+
+
+def get_read_session_factory(request: Request) -> sessionmaker:
+    """ Session factory for read-only work: a replica when one is configured, else the primary. Use it
+    directly for work that outlives the handler, such as a streamed response. """
+    session_factory = None if reads_from_primary(request) else choose_replica()
+    return session_factory or async_session
+
+
+async def get_read_session(request: Request) -> AsyncSession:
+    """ Session for read-only handlers: a replica when one is configured, else the primary. """
+    async with get_read_session_factory(request)() as session:
+        yield session
@@ -0,0 +1,108 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from redis.exceptions import RedisError
+
+from config import Config
+from db.redis import redis_client
+from metrics import rate_limit_decisions_total
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# Refills the bucket for the time since its last use, then takes one token if there is one. Runs
+# atomically in Redis on Redis's own clock, so every worker sees the same bucket. Returns whether the
+# request is allowed and, when it is not, the seconds until the next token (as a string, Redis would
+# truncate a Lua float to an integer).
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(bucket[1]) or capacity
+local at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - at) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = (1 - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate))
+return {allowed, tostring(retry_after)}
+"""
+
+
+class Rate(NamedTuple):
+    capacity: int  # Requests allowed in a burst
+    per_second: float  # Tokens added back per second
+
+
+def parse_rate(rate: str) -> Rate:
+    """ Parses a limit such as "5/minute" into a bucket of 5 tokens refilled over a minute. """
+    count, _, period = rate.partition("/")
+    if period not in PERIODS:
+        raise ValueError(f"Rate limit period must be one of {', '.join(PERIODS)}: {rate!r}")
+    return Rate(int(count), int(count) / PERIODS[period])
+
+
+class RateLimiter:
+    """Token buckets in Redis, fronted by a per-process record of buckets known to be empty"""
+
+    def __init__(self, max_local_keys: int):
+        self.max_local_keys = max_local_keys
+        self._empty_until = OrderedDict()  # Bucket key -> monotonic time its next token is due
+        self._take_token = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def known_empty(self, scope: str, key: str) -> float:
+        """ Seconds until the key's next token when this process already knows its bucket is empty, else 0. """
+        # A denied request takes no token, so an empty bucket stays empty until its next token is due
+        # and every request before then can be refused here without asking Redis
+        empty_until = self._empty_until.get(key)
+        if empty_until is None:
+            return 0.0
+
+        remaining = empty_until - time.monotonic()
+        if remaining <= 0:
+            del self._empty_until[key]
+            return 0.0
+
+        rate_limit_decisions_total.inc(scope, "denied_local")
+        return remaining
+
+    async def take(self, scope: str, key: str, rate: Rate) -> float:
+        """ Takes a token for the key. Returns 0 when the request may go ahead, otherwise the seconds
+        until it may be retried. """
+        retry_after = self.known_empty(scope, key)
+        if retry_after:
+            return retry_after
+
+        try:
+            allowed, retry_after = await self._take_token(keys=[f"ratelimit:{key}"], args=[rate.capacity, rate.per_second])
+        except RedisError as e:
+            # Fail open: a Redis outage must not lock every user out of the auth routes
+            logging.warning(f"Rate limit check skipped, Redis unavailable: {e}")
+            rate_limit_decisions_total.inc(scope, "error")
+            return 0.0
+
+        if allowed:
+            rate_limit_decisions_total.inc(scope, "allowed")
+            return 0.0
+
+        retry_after = float(retry_after)
+        self._empty_until[key] = time.monotonic() + retry_after
+        if len(self._empty_until) > self.max_local_keys:
+            self._empty_until.popitem(last=False)
+        rate_limit_decisions_total.inc(scope, "denied")
+        return retry_after
+
+
+rate_limiter = RateLimiter(Config.RATE_LIMIT_LOCAL_KEYS)
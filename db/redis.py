@@ -1,22 +1,142 @@
+import asyncio
+import logging
+import time
+import uuid
+
 import redis.asyncio as redis
+from redis.exceptions import RedisError
 
 from config import Config
+from db.bloom import BloomFilter
+from metrics import redis_command_duration_seconds
 
 JTI_EXPIRY = 3600
+JTI_REVOKED_CHANNEL = "jti:revoked"
+JTI_REVOKED_INDEX = "jti:revoked_index"  # Sorted set of revoked JTIs scored by expiry time, the filter is rebuilt from it
+JTI_INDEX_SEEDED = "jti:revoked_index_seeded"
+
+
+class InstrumentedRedis(redis.Redis):
+    """Redis client that records the latency of every command it runs"""
+
+    async def execute_command(self, *args, **options):
+        start_time = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            redis_command_duration_seconds.observe(time.perf_counter() - start_time, args[0])
 
-jti_blocklist = redis.Redis(
+
+# Shared client for the JTI blocklist and the read caches
+redis_client = InstrumentedRedis(
     host=Config.REDIS_HOST,
     port=Config.REDIS_PORT,
     db=0  # Uses the default Redis database
 )
 
 
+class RevokedJtiFilter:
+    """Per-process Bloom filter of revoked JTIs, kept in sync with the Redis blocklist over pub/sub"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.ready = False  # Until synced, every lookup goes to Redis
+        self._task = None
+
+    def might_contain(self, jti: str) -> bool:
+        return not self.ready or jti in self.bloom
+
+    def add(self, jti: str) -> None:
+        self.bloom.add(jti)
+
+    async def _seed_index(self) -> None:
+        # Blocklist entries written before the index existed are bare JTI keys; copy the live ones in once.
+        # Only UUID-shaped keys are taken, so Celery's keys in the same database are never mistaken for JTIs
+        async for key in redis_client.scan_iter(match="*-*-*-*-*", count=1000):
+            try:
+                jti = str(uuid.UUID(key.decode()))
+            except ValueError:
+                continue
+            ttl = await redis_client.ttl(key)
+            if ttl > 0:
+                await redis_client.zadd(JTI_REVOKED_INDEX, {jti: time.time() + ttl})
+
+        await redis_client.set(JTI_INDEX_SEEDED, "")
+
+    async def _rebuild(self) -> None:
+        if not await redis_client.exists(JTI_INDEX_SEEDED):
+            await self._seed_index()
+
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        await redis_client.zremrangebyscore(JTI_REVOKED_INDEX, "-inf", time.time())
+        async for jti, _ in redis_client.zscan_iter(JTI_REVOKED_INDEX, count=1000):
+            bloom.add(jti.decode())
+
+        self.bloom = bloom
+
+    async def _sync(self) -> None:
+        while True:
+            try:
+                async with redis_client.pubsub() as pubsub:
+                    # Subscribe before loading the blocklist so no revocation falls between the two
+                    await pubsub.subscribe(JTI_REVOKED_CHANNEL)
+                    await self._rebuild()
+                    self.ready = True
+                    rebuilt_at = time.monotonic()
+
+                    while True:
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                        if message is not None:
+                            self.add(message['data'].decode())
+
+                        # Start from an empty filter once every JTI in it has expired from Redis
+                        if time.monotonic() - rebuilt_at >= JTI_EXPIRY:
+                            await self._rebuild()
+                            rebuilt_at = time.monotonic()
+
+            except Exception as e:
+                if isinstance(e, RedisError):
+                    logging.warning(f"JTI filter sync lost, retrying: {e}")
+                else:
+                    logging.exception("JTI filter sync failed, retrying")
+            finally:
+                # Revocations may be missed until the filter is synced again, so fall back to Redis for every
+                # lookup; also on cancellation, so a stopped filter never answers on its own
+                self.ready = False
+
+            await asyncio.sleep(1)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._sync())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.ready = False
+
+
+revoked_jti_filter = RevokedJtiFilter(Config.JTI_FILTER_CAPACITY, Config.JTI_FILTER_ERROR_RATE)
+
+
 async def add_jti_to_blocklist(jti: str) -> None:
-    """ Adds a JTI to the Redis blocklist with an expiration time. """
-    await jti_blocklist.set(name=jti, value="", ex=JTI_EXPIRY)
+    """ Adds a JTI to the Redis blocklist with an expiration time and tells every worker about it. """
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.set(name=jti, value="", ex=JTI_EXPIRY)
+        pipe.zadd(JTI_REVOKED_INDEX, {jti: time.time() + JTI_EXPIRY})
+        pipe.zremrangebyscore(JTI_REVOKED_INDEX, "-inf", time.time())
+        await pipe.execute()
+    revoked_jti_filter.add(jti)
+    await redis_client.publish(JTI_REVOKED_CHANNEL, jti)
 
 
 async def jti_in_blocklist(jti: str) -> bool:
-    """ Checks if a JTI exists in the Redis blocklist. """
-    result = await jti_blocklist.get(jti)
-    return result is not None  # If Redis returns None, JTI is not blocked
\ No newline at end of file
+    """ Checks if a JTI exists in the Redis blocklist, asking Redis only when the local filter might contain it. """
+    if not revoked_jti_filter.might_contain(jti):
+        return False
+
+    result = await redis_client.get(jti)
+    return result is not None  # If Redis returns None, JTI is not blocked
@@ -0,0 +1,85 @@
+import asyncio
+import contextvars
+import logging
+import random
+import re
+from collections import deque
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import Config
+from metrics import Counter
+
+db_slow_queries_total = Counter("db_slow_queries_total", "Queries slower than DB_SLOW_QUERY_MS")
+
+# Most recent slow queries of this process, oldest dropped first
+slow_query_log = deque(maxlen=Config.DB_SLOW_QUERY_LOG_SIZE)
+
+_explains_in_flight = 0
+
+# A locking read takes its row locks again when explained, waiting on (or skipping past) the rows the
+# original transaction still holds
+LOCKING_CLAUSE = re.compile(r"\bFOR\s+(UPDATE|SHARE|NO\s+KEY\s+UPDATE|KEY\s+SHARE)\b", re.IGNORECASE)
+
+
+def redact_parameters(parameters):
+    """ Replaces every bind value with its type name so no user data ends up in the log. """
+    if isinstance(parameters, dict):
+        return {key: redact_parameters(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact_parameters(value) for value in parameters]
+    return None if parameters is None else f"<{type(parameters).__name__}>"
+
+
+def is_explainable(statement: str) -> bool:
+    """ True for a plain SELECT, which EXPLAIN ANALYZE can run again without writing or locking rows. """
+    return statement.lstrip()[:6].upper() == "SELECT" and LOCKING_CLAUSE.search(statement) is None
+
+
+def record_slow_query(async_engine: Optional[AsyncEngine], statement: str, parameters, duration: float) -> None:
+    """ Adds a slow query to the log and, for a sample of SELECTs on Postgres, captures its plan. """
+    global _explains_in_flight
+    db_slow_queries_total.inc()
+    entry = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "duration_ms": round(duration * 1000, 2),
+        "statement": statement,
+        "parameters": redact_parameters(parameters),
+        "plan": None,
+    }
+    slow_query_log.append(entry)
+    logging.warning(f"Slow query ({entry['duration_ms']} ms): {statement[:200]}")
+
+    if (
+        async_engine is not None
+        and async_engine.dialect.name == "postgresql"
+        and is_explainable(statement)  # EXPLAIN ANALYZE runs the statement, never repeat a write or a lock
+        and _explains_in_flight < Config.DB_SLOW_QUERY_MAX_EXPLAINS
+        and random.random() < Config.DB_SLOW_QUERY_EXPLAIN_RATE
+    ):
+        _explains_in_flight += 1
+        # An empty context keeps the plan query out of the query stats of the request that triggered it
+        asyncio.get_running_loop().create_task(
+            capture_plan(async_engine, entry, statement, parameters), context=contextvars.Context()
+        )
+
+
+async def capture_plan(async_engine: AsyncEngine, entry: dict, statement: str, parameters) -> None:
+    """ Runs EXPLAIN (ANALYZE, BUFFERS) on its own pooled connection and stores the plan on the entry. """
+    global _explains_in_flight
+    try:
+        async with async_engine.connect() as conn:
+            result = await conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", tuple(parameters or ()))
+            entry["plan"] = "\n".join(row[0] for row in result)
+            await conn.rollback()
+    except Exception as e:
+        entry["plan"] = f"EXPLAIN failed: {e}"
+    finally:
+        _explains_in_flight -= 1
+
+
+def get_slow_queries() -> List[dict]:
+    """ Returns the logged slow queries, slowest first. """
+    return sorted(slow_query_log, key=lambda entry: entry["duration_ms"], reverse=True)
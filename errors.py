@@ -1,3 +1,4 @@
+import math
 from typing import Any, Callable
 from fastapi.requests import Request
 from fastapi.responses import JSONResponse
@@ -88,6 +89,32 @@ class PasswordDoNotMatch(BooklyException):
     pass
 
 
+class InvalidCursor(BooklyException):
+    """User has provided a malformed pagination cursor"""
+
+    pass
+
+
+class PasswordHashingBusy(BooklyException):
+    """Too many password hash or verify calls are already queued"""
+
+    pass
+
+
+class UnsupportedImportFormat(BooklyException):
+    """Bulk import body is neither NDJSON nor CSV"""
+
+    pass
+
+
+class RateLimited(BooklyException):
+    """Client has made too many requests to a rate limited route"""
+
+    def __init__(self, retry_after: float):
+        super().__init__()
+        self.retry_after = retry_after
+
+
 def create_exception_handler(
     status_code: int, initial_detail: Any
 ) -> Callable[[Request, Exception], JSONResponse]:
@@ -254,6 +281,54 @@ def register_all_errors(app: FastAPI):
         ),
     )
 
+    app.add_exception_handler(
+        InvalidCursor,
+        create_exception_handler(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            initial_detail={
+                "message": "Pagination cursor is invalid",
+                "error_code": "invalid_cursor",
+                "status_code": status.HTTP_400_BAD_REQUEST,
+            },
+        ),
+    )
+
+    app.add_exception_handler(
+        PasswordHashingBusy,
+        create_exception_handler(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            initial_detail={
+                "message": "Server is busy, please try again shortly",
+                "error_code": "password_hashing_busy",
+                "status_code": status.HTTP_503_SERVICE_UNAVAILABLE,
+            },
+        ),
+    )
+    app.add_exception_handler(
+        UnsupportedImportFormat,
+        create_exception_handler(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            initial_detail={
+                "message": "Send the import as application/x-ndjson or text/csv",
+                "error_code": "unsupported_import_format",
+                "status_code": status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            },
+        ),
+    )
+
+    @app.exception_handler(RateLimited)
+    async def rate_limited(request, exc: RateLimited):
+
+        return JSONResponse(
+            content={
+                "message": "Too many requests, please try again later",
+                "error_code": "rate_limited",
+                "status_code": status.HTTP_429_TOO_MANY_REQUESTS,
+            },
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={"Retry-After": str(math.ceil(exc.retry_after))},
+        )
+
     @app.exception_handler(500)
     async def internal_server_error(request, exc):
 
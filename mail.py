@@ -1,6 +1,15 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from email.utils import formataddr
 from pathlib import Path
+from typing import List, Optional
 
+import aiosmtplib
 from fastapi_mail import FastMail, ConnectionConfig, MessageSchema, MessageType
+from fastapi_mail.msg import MailMsg
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 
 from config import Config
 
@@ -24,6 +33,24 @@ mail = FastMail(
     config=mail_config
 )
 
+# Each template is compiled on first use and kept for the life of the process; with auto_reload off a
+# cached template is never checked against the file on disk again
+template_env = Environment(
+    loader=FileSystemLoader(mail_config.TEMPLATE_FOLDER),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=False,
+)
+
+
+def load_templates() -> None:
+    """ Compiles every email template up front, so the first message of each kind does not pay for it. """
+    for name in template_env.list_templates(extensions=["html"]):
+        template_env.get_template(name)
+
+
+def render_template(name: str, context: dict) -> str:
+    return template_env.get_template(name).render(**context)
+
 
 def create_message(recipients: list[str], subject: str, body: str):
 
@@ -37,12 +64,147 @@ def create_message(recipients: list[str], subject: str, body: str):
     return message
 
 
+class SMTPConnectionPool:
+    """Authenticated SMTP connections kept open between messages, so each email skips the connect, TLS handshake
+    and login FastMail.send_message pays for. Bound to the event loop that first uses it."""
+
+    def __init__(self, config: ConnectionConfig, size: int, max_idle: float):
+        self.config = config
+        self.size = size
+        self.max_idle = max_idle  # Seconds a connection may sit unused before it is checked with NOOP
+        self._idle = deque()  # (connection, last used) pairs, most recently used last
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.stats = {"connects": 0, "reconnects": 0, "sent": 0}
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(
+            hostname=self.config.MAIL_SERVER,
+            port=self.config.MAIL_PORT,
+            timeout=self.config.TIMEOUT,
+            use_tls=self.config.MAIL_SSL_TLS,
+            start_tls=self.config.MAIL_STARTTLS,
+            validate_certs=self.config.VALIDATE_CERTS,
+        )
+        await smtp.connect()
+        if self.config.USE_CREDENTIALS:
+            await smtp.login(self.config.MAIL_USERNAME, self.config.MAIL_PASSWORD.get_secret_value())
+
+        self.stats["connects"] += 1
+        return smtp
+
+    async def _checkout(self) -> aiosmtplib.SMTP:
+        while self._idle:
+            smtp, last_used = self._idle.pop()
+            if not smtp.is_connected:
+                continue
+
+            if time.monotonic() - last_used > self.max_idle:
+                # Servers drop idle sessions, often without telling the client; find out before sending
+                try:
+                    await smtp.noop()
+                except (aiosmtplib.SMTPException, OSError):
+                    smtp.close()
+                    continue
+
+            return smtp
+
+        return await self._connect()
+
+    async def _deliver(self, smtp: aiosmtplib.SMTP, msg) -> aiosmtplib.SMTP:
+        """ Sends on the given connection, reconnecting once if the server has dropped it. Returns the connection used. """
+        try:
+            await smtp.send_message(msg)
+        except aiosmtplib.SMTPServerDisconnected:
+            smtp.close()
+            self.stats["reconnects"] += 1
+            smtp = await self._connect()
+            await smtp.send_message(msg)
+        return smtp
+
+    async def send_batch(self, messages: List[MessageSchema]) -> List[Optional[Exception]]:
+        """ Sends the messages one after another over a single pooled connection. Returns, per message, None
+        when it was sent or the error that stopped it; once the connection fails the rest of the batch gets that error. """
+        sender = formataddr((self.config.MAIL_FROM_NAME, self.config.MAIL_FROM)) if self.config.MAIL_FROM_NAME else self.config.MAIL_FROM
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+
+        results = []
+        async with self._slots:
+            smtp = None
+            try:
+                smtp = await self._checkout()
+                for message in messages:
+                    # Built the same way FastMail.send_message builds it; a private API, so fastapi-mail is pinned in requirements.txt
+                    msg = await MailMsg(message)._message(sender)
+                    try:
+                        smtp = await self._deliver(smtp, msg)
+                    except (aiosmtplib.SMTPRecipientsRefused, aiosmtplib.SMTPSenderRefused, aiosmtplib.SMTPDataError) as e:
+                        results.append(e)  # The message was refused, the connection is fine
+                        continue
+
+                    results.append(None)
+                    self.stats["sent"] += 1
+
+            except (aiosmtplib.SMTPException, OSError) as e:
+                if smtp is not None:
+                    smtp.close()
+                return results + [e] * (len(messages) - len(results))
+            except BaseException:
+                if smtp is not None:
+                    smtp.close()
+                raise
+
+            self._idle.append((smtp, time.monotonic()))
+        return results
+
+    async def send(self, message: MessageSchema) -> None:
+        """ Sends a message on a pooled connection, reconnecting once if the server has dropped it. """
+        error = (await self.send_batch([message]))[0]
+        if error is not None:
+            raise error
+
+    async def close(self) -> None:
+        while self._idle:
+            smtp, _ = self._idle.pop()
+            try:
+                await smtp.quit()
+            except (aiosmtplib.SMTPException, OSError) as e:
+                logging.debug(f"SMTP quit failed: {e}")
+                smtp.close()
+
+
+smtp_pool = SMTPConnectionPool(mail_config, size=Config.MAIL_POOL_SIZE, max_idle=Config.MAIL_POOL_MAX_IDLE)
+
+# One event loop per worker process, created on first use (after the prefork fork) and kept for the
+# life of the process so pooled connections survive from one task to the next
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_worker_loop() -> asyncio.AbstractEventLoop:
+    global _worker_loop
+    if _worker_loop is None or _worker_loop.is_closed():
+        _worker_loop = asyncio.new_event_loop()
+    return _worker_loop
+
+
 async def send_message_async(message):
-    fm = FastMail(mail_config)
-    return await fm.send_message(message)
+    return await smtp_pool.send(message)
 
 
 def send_message_sync(message):
-    import asyncio
-    loop = asyncio.get_event_loop()
-    return loop.run_until_complete(send_message_async(message))
\ No newline at end of file
+    """ Sends a message from synchronous code such as a Celery task, on the worker's long-lived loop. """
+    return get_worker_loop().run_until_complete(smtp_pool.send(message))
+
+
+def send_batch_sync(messages: List[MessageSchema]) -> List[Optional[Exception]]:
+    """ Sends a batch over one SMTP session from synchronous code, on the worker's long-lived loop. """
+    return get_worker_loop().run_until_complete(smtp_pool.send_batch(messages))
+
+
+def close_worker_loop() -> None:
+    global _worker_loop
+    if _worker_loop is not None and not _worker_loop.is_closed():
+        _worker_loop.run_until_complete(smtp_pool.close())
+        _worker_loop.close()
+    _worker_loop = None
@@ -0,0 +1,116 @@
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Callable, List
+
+# Metric values are plain per-process dicts updated from the event loop thread, so recording takes
+# no locks. Each worker exposes its own values on /metrics; sum them across workers when querying.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = []
+_collectors: List[Callable[[], List[str]]] = []
+
+
+def _format_labels(labelnames: tuple, labelvalues: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic count, optionally split by label values passed positionally"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = defaultdict(float)
+        _metrics.append(self)
+
+    def inc(self, *labelvalues, amount: float = 1.0) -> None:
+        self.values[labelvalues] += amount
+
+    def collect(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in self.values.items()]
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    type = "gauge"
+
+    def dec(self, *labelvalues, amount: float = 1.0) -> None:
+        self.values[labelvalues] -= amount
+
+    def set(self, value: float, *labelvalues) -> None:
+        self.values[labelvalues] = value
+
+
+class Histogram:
+    """Distribution of observed values over fixed upper-bound buckets"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts (last one is +Inf), sum]; counts are made cumulative only when rendering
+        self.values = {}
+        _metrics.append(self)
+
+    def observe(self, value: float, *labelvalues) -> None:
+        series = self.values.get(labelvalues)
+        if series is None:
+            series = self.values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def collect(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+def register_collector(collector: Callable[[], List[str]]) -> None:
+    """ Registers a callable that returns extra exposition lines, read only when /metrics is scraped. """
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    """ Renders every metric in the Prometheus text exposition format. """
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.collect())
+
+    for collector in _collectors:
+        lines.extend(collector())
+
+    return "\n".join(lines) + "\n"
+
+
+http_requests_total = Counter("http_requests_total", "HTTP requests handled", ("method", "route", "status"))
+http_request_duration_seconds = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being handled")
+
+db_pool_checkouts_total = Counter("db_pool_checkouts_total", "Connections checked out of the database pool", ("engine",))
+db_pool_checkout_wait_seconds = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled database connection", ("engine",))
+
+redis_command_duration_seconds = Histogram("redis_command_duration_seconds", "Redis command latency", ("command",))
+rate_limit_decisions_total = Counter("rate_limit_decisions_total", "Rate limit checks by where they were decided", ("scope", "decision"))
+
+celery_tasks_enqueued_total = Counter("celery_tasks_enqueued_total", "Celery tasks published to the broker", ("task",))
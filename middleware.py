@@ -1,29 +1,202 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
 import time
+from logging.handlers import QueueHandler, QueueListener
 
-from fastapi import FastAPI, status
-from fastapi.requests import Request
-from starlette.responses import JSONResponse
+from fastapi import FastAPI
+from starlette.types import ASGIApp, Receive, Scope, Send
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 
+from config import Config
+from db.db import replica_engines, READ_PRIMARY_COOKIE, READ_PRIMARY_HEADER, QueryStats, request_query_stats
+from metrics import http_requests_total, http_request_duration_seconds, http_requests_in_flight
 
-def register_middleware(app: FastAPI):
+access_logger = logging.getLogger("bookly.access")
+access_logger.propagate = False
+
+_access_log_listener = None
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queues the raw record so formatting and I/O both happen on the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps({"time": record.created, **record.msg}, separators=(",", ":"))
+
+
+def start_access_log_listener(handler: logging.Handler = None) -> None:
+    """ Routes access log records through an in-memory queue to a background writer thread. """
+    global _access_log_listener
+    if _access_log_listener is not None:
+        return
+
+    if handler is None:
+        handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    access_logger.addHandler(DeferredQueueHandler(log_queue))
+    access_logger.setLevel(logging.INFO)
+
+    _access_log_listener = QueueListener(log_queue, handler)
+    _access_log_listener.start()
+    atexit.register(_access_log_listener.stop)  # Flush whatever is still queued on shutdown
+
+
+class AccessLogMiddleware:
+    """Pure ASGI middleware that times each request and logs a structured access record for a sample of them"""
+
+    def __init__(self, app: ASGIApp, sample_rate: float = 1.0) -> None:
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status_code = 500  # Reported if the app fails before sending a response
+
+        async def send_wrapper(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            access_logger.info({
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "duration_ms": round((time.perf_counter() - start_time) * 1000, 3),
+                "client": scope["client"][0] if scope.get("client") else None,
+            })
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware that records per-route request counts, latency and in-flight requests"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
 
-    @app.middleware('http')
-    async def custom_logging(request: Request, call_next):
-        """Custom logging middleware that logs the time before and after handling the request."""
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        start_time = time.time()
-        print(f"--- Request Start ---\nTime: {start_time}\nPath: {request.url.path}")
+        start_time = time.perf_counter()
+        status_code = 500
+        http_requests_in_flight.inc()
 
-        # Forward the request to the next middleware or route handler and await the response
-        response = await call_next(request)
+        async def send_wrapper(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
 
-        end_time = time.time()
-        duration = round(end_time - start_time, 4)
-        print(f"--- Request End ---\nTime: {end_time}\nDuration: {duration} seconds\nPath: {request.url.path}")
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            # Label by route template, not the raw path, so ids in URLs don't create a series per request
+            route = scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            http_requests_total.inc(scope["method"], route_path, status_code)
+            http_request_duration_seconds.observe(time.perf_counter() - start_time, scope["method"], route_path)
+
+
+class ReadYourWritesMiddleware:
+    """Pure ASGI middleware that pins a client's reads to the primary for a short window after a successful write"""
+
+    SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+    def __init__(self, app: ASGIApp, window: int) -> None:
+        self.app = app
+        self.window = window
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] in self.SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                read_primary_until = str(round(time.time() + self.window, 3)).encode()
+                cookie = b"%s=%s; Max-Age=%d; Path=/; HttpOnly" % (READ_PRIMARY_COOKIE.encode(), read_primary_until, self.window)
+                headers = list(message.get("headers", []))
+                headers.append((b"set-cookie", cookie))
+                headers.append((READ_PRIMARY_HEADER.encode(), read_primary_until))  # For clients that don't keep cookies
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class QueryCounterMiddleware:
+    """Pure ASGI middleware that reports each request's query count and database time in a Server-Timing header,
+    and logs requests that go over the query budget or repeat one statement often enough to look like an N+1"""
+
+    def __init__(self, app: ASGIApp, budget: int, n_plus_one_threshold: int) -> None:
+        self.app = app
+        self.budget = budget
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = request_query_stats.set(stats)
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start":
+                server_timing = f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries"'.encode()
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", server_timing)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_query_stats.reset(token)
+            self.check_budget(scope, stats)
+
+    def check_budget(self, scope: Scope, stats: QueryStats) -> None:
+        if stats.count == 0:
+            return
+
+        route = scope.get("route")
+        route_path = route.path if route is not None else scope["path"]
+
+        if stats.count > self.budget:
+            logging.warning(f"{scope['method']} {route_path} ran {stats.count} queries, over the budget of {self.budget}")
+
+        statement, repeats = stats.statements.most_common(1)[0]
+        if repeats >= self.n_plus_one_threshold:
+            logging.warning(f"{scope['method']} {route_path} ran the same query {repeats} times, likely an N+1: {statement}")
+
+
+def register_middleware(app: FastAPI):
 
-        return response
+    app.add_middleware(QueryCounterMiddleware, budget=Config.DB_QUERY_BUDGET, n_plus_one_threshold=Config.DB_N_PLUS_ONE_THRESHOLD)
+    app.add_middleware(MetricsMiddleware)
+    if replica_engines:
+        app.add_middleware(ReadYourWritesMiddleware, window=Config.DB_REPLICA_LAG_WINDOW)
+    app.add_middleware(AccessLogMiddleware, sample_rate=Config.ACCESS_LOG_SAMPLE_RATE)
+    start_access_log_listener()
 
 
     # @app.middleware('http')
@@ -0,0 +1,44 @@
+"""add review listing indexes
+
+Revision ID: 5a0d93be7c16
+Revises: d84c2e61f0b7
+Create Date: 2026-10-18 16:48:52.190377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a0d93be7c16'
+down_revision: Union[str, None] = 'd84c2e61f0b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# name, columns
+INDEXES = [
+    ('ix_reviews_book_uid_created_at_uid', ['book_uid', 'created_at', 'uid']),  # Newest first review pages
+    ('ix_reviews_book_uid_rating_uid', ['book_uid', 'rating', 'uid']),  # Best rated first review pages
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.drop_index(name, table_name='reviews', postgresql_concurrently=True, if_exists=True)
+            op.create_index(name, 'reviews', columns, unique=False, postgresql_concurrently=True)
+
+        # Lookups by book_uid alone are served by the leading column of the new indexes
+        op.drop_index('ix_reviews_book_uid', table_name='reviews', postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_reviews_book_uid', table_name='reviews', postgresql_concurrently=True, if_exists=True)
+        op.create_index('ix_reviews_book_uid', 'reviews', ['book_uid'], unique=False, postgresql_concurrently=True)
+
+        for name, columns in reversed(INDEXES):
+            op.drop_index(name, table_name='reviews', postgresql_concurrently=True, if_exists=True)
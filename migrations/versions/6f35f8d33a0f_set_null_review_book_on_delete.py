@@ -0,0 +1,29 @@
+"""set null review book on delete
+
+Revision ID: 6f35f8d33a0f
+Revises: 32061d48c7e7
+Create Date: 2026-10-18 11:41:05.302117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6f35f8d33a0f'
+down_revision: Union[str, None] = '32061d48c7e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_constraint('reviews_book_uid_fkey', 'reviews', type_='foreignkey')
+    op.create_foreign_key('reviews_book_uid_fkey', 'reviews', 'books', ['book_uid'], ['uid'], ondelete='SET NULL')
+
+
+def downgrade() -> None:
+    op.drop_constraint('reviews_book_uid_fkey', 'reviews', type_='foreignkey')
+    op.create_foreign_key('reviews_book_uid_fkey', 'reviews', 'books', ['book_uid'], ['uid'])
@@ -0,0 +1,27 @@
+"""add books keyset pagination index
+
+Revision ID: 85491b9e5587
+Revises: 94ca98d730d9
+Create Date: 2026-10-18 09:12:40.118342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '85491b9e5587'
+down_revision: Union[str, None] = '94ca98d730d9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_books_created_at_uid', 'books', ['created_at', 'uid'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_books_created_at_uid', table_name='books')
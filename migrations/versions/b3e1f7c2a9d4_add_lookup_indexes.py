@@ -0,0 +1,43 @@
+"""add lookup indexes
+
+Revision ID: b3e1f7c2a9d4
+Revises: 6f35f8d33a0f
+Create Date: 2026-10-18 14:02:37.551904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e1f7c2a9d4'
+down_revision: Union[str, None] = '6f35f8d33a0f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# name, table, columns, unique
+INDEXES = [
+    ('ix_users_email', 'users', ['email'], True),  # get_user_by_email, on every login and signup
+    ('ix_books_user_uid_created_at_uid', 'books', ['user_uid', 'created_at', 'uid'], False),  # get_user_books keyset pages
+    ('ix_reviews_book_uid', 'reviews', ['book_uid'], False),  # Book.reviews loads
+    ('ix_reviews_user_uid', 'reviews', ['user_uid'], False),  # User.reviews loads
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY does not block writes but cannot run inside a transaction.
+    # A failed concurrent build leaves an INVALID index behind, so drop any leftover first
+    # and the migration can simply be re-run. Duplicate emails make ix_users_email fail.
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+            op.create_index(name, table, columns, unique=unique, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
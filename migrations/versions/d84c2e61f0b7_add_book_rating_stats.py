@@ -0,0 +1,43 @@
+"""add book rating stats
+
+Revision ID: d84c2e61f0b7
+Revises: b3e1f7c2a9d4
+Create Date: 2026-10-18 15:26:11.804213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd84c2e61f0b7'
+down_revision: Union[str, None] = 'b3e1f7c2a9d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+STAT_COLUMNS = ['review_count', 'rating_sum'] + [f'rating_count_{rating}' for rating in range(0, 5)]
+
+
+def upgrade() -> None:
+    # A constant default does not rewrite the table. Existing books start at 0 until
+    # `python -m commands.backfill_rating_stats` is run.
+    for column in STAT_COLUMNS:
+        op.add_column('books', sa.Column(column, sa.Integer(), server_default='0', nullable=False))
+
+    # Must match api.v1.books.models.RATING_AVERAGE exactly for the planner to use it
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_books_rating_average_uid', table_name='books', postgresql_concurrently=True, if_exists=True)
+        op.create_index(
+            'ix_books_rating_average_uid', 'books',
+            [sa.text('coalesce(CAST(rating_sum AS FLOAT) / nullif(review_count, 0), 0)'), 'uid'],
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_books_rating_average_uid', table_name='books')
+    for column in reversed(STAT_COLUMNS):
+        op.drop_column('books', column)
@@ -0,0 +1,68 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+
+from errors import InvalidCursor
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def _encode(payload: dict) -> str:
+    data = json.dumps(payload, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> dict:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode()))
+
+
+def encode_cursor(created_at: datetime, uid: uuid.UUID) -> str:
+    """ Encodes the (created_at, uid) sort key of the last row of a page into an opaque cursor. """
+    return _encode({"c": created_at.isoformat(), "u": str(uid)})
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    """ Decodes a cursor produced by encode_cursor back into its (created_at, uid) sort key. """
+    try:
+        payload = _decode(cursor)
+        return datetime.fromisoformat(payload["c"]), uuid.UUID(payload["u"])
+
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor()
+
+
+def encode_rank_cursor(rank: float, uid: uuid.UUID) -> str:
+    """ Encodes the (rank, uid) sort key of the last row of a ranked search page into an opaque cursor. """
+    return _encode({"r": rank, "u": str(uid)})
+
+
+def decode_rank_cursor(cursor: str) -> tuple[float, uuid.UUID]:
+    """ Decodes a cursor produced by encode_rank_cursor back into its (rank, uid) sort key. """
+    try:
+        payload = _decode(cursor)
+        return float(payload["r"]), uuid.UUID(payload["u"])
+
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor()
+
+
+def encode_rating_cursor(rating: int, uid: uuid.UUID) -> str:
+    """ Encodes the (rating, uid) sort key of the last row of a best-rated-first review page into an opaque cursor. """
+    return _encode({"r": rating, "u": str(uid)})
+
+
+def decode_rating_cursor(cursor: str) -> tuple[int, uuid.UUID]:
+    """ Decodes a cursor produced by encode_rating_cursor. The rating stays an int, so the keyset comparison
+    binds the same type as the integer column and the (book_uid, rating, uid) index can serve it. """
+    try:
+        payload = _decode(cursor)
+        rating = payload["r"]
+        if not isinstance(rating, int) or isinstance(rating, bool):
+            raise InvalidCursor()
+        return rating, uuid.UUID(payload["u"])
+
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor()
@@ -1,14 +1,31 @@
 
 from fastapi.testclient import TestClient
 from datetime import datetime
-from unittest.mock import Mock
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock
+import asyncio
+import re
+import socket
 import pytest
 import uuid
 
+from sqlalchemy import Column, MetaData, Table
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.types import Uuid
+from sqlmodel import SQLModel
+from fastapi_mail import ConnectionConfig
+from sqlmodel.ext.asyncio.session import AsyncSession
+
 from api.v1.auth.dependency import AccessTokenBearer, RefreshTokenBearer, CheckRole
+from api.v1.auth.models import User
+from api.v1.auth.utils import create_access_token, generate_password_hash
 from api.v1.books.models import Book
+from api.v1.reviews.models import Review
 from app import app
-from db.db import get_session
+from db.db import get_session, get_read_session, get_read_session_factory, instrument_engine
 
 mock_session = Mock()
 mock_user_service = Mock()
@@ -23,6 +40,7 @@ refresh_token_bearer = RefreshTokenBearer()
 role_checker = CheckRole(['admin'])
 
 app.dependency_overrides[get_session] = get_mock_session
+app.dependency_overrides[get_read_session] = get_mock_session
 app.dependency_overrides[role_checker] = Mock()
 app.dependency_overrides[refresh_token_bearer]= Mock()
 
@@ -57,4 +75,151 @@ def test_book():
         language="English",
         published_date=datetime.now(),
         update_at=datetime.now()
-    )
\ No newline at end of file
+    )
+
+
+def create_sqlite_tables(sync_conn):
+    """Creates the app tables on SQLite, leaving out Postgres-only columns such as the search vector"""
+    metadata = MetaData()
+    for table in SQLModel.metadata.sorted_tables:
+        columns = [Column(c.name, c.type, primary_key=c.primary_key) for c in table.columns if not isinstance(c.type, TSVECTOR)]
+        Table(table.name, metadata, *columns)
+    metadata.create_all(sync_conn)
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/test.db", poolclass=NullPool)
+
+    async def create_tables():
+        async with engine.begin() as conn:
+            await conn.run_sync(create_sqlite_tables)
+
+    asyncio.run(create_tables())
+    return engine
+
+
+async def seed_api_data(session_factory) -> SimpleNamespace:
+    now = datetime.now()
+    user = User(uid=uuid.uuid4(), username="jod35", email="jodestrevin@gmail.com", first_name="jonathan", last_name="ssali",
+                role="user", is_verified=True, password_hash=generate_password_hash("test1234"), created_at=now, updated_at=now)
+    book = Book(uid=uuid.uuid4(), user_uid=user.uid, title="sample title", author="sample author", publisher="sample publisher",
+                published_date=now.date(), page_count=200, language="English", created_at=now, updated_at=now)
+    reviews = [Review(uid=uuid.uuid4(), user_uid=user.uid, book_uid=book.uid, rating=4, review_text="sample review",
+                      created_at=now, updated_at=now) for _ in range(3)]
+
+    async with session_factory() as session:
+        session.add_all([user, book, *reviews])
+        await session.commit()
+
+    return SimpleNamespace(user_uid=str(user.uid), email=user.email, password="test1234", book_uid=str(book.uid))
+
+
+def uuid_bind_processor_accepting_str(bind_processor):
+    # asyncpg takes the str ids the services pass around, SQLite's Uuid type only takes uuid.UUID
+    def wrapper(self, dialect):
+        process = bind_processor(self, dialect)
+        if process is None:
+            return None
+        return lambda value: process(uuid.UUID(value) if isinstance(value, str) else value)
+
+    return wrapper
+
+
+@pytest.fixture
+def api_client(sqlite_engine, monkeypatch):
+    """TestClient for an authenticated, verified user, backed by a seeded SQLite database instead of mocks"""
+    monkeypatch.setattr(Uuid, "bind_processor", uuid_bind_processor_accepting_str(Uuid.bind_processor))
+    instrument_engine(sqlite_engine)
+    session_factory = sessionmaker(bind=sqlite_engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def get_sqlite_session():
+        async with session_factory() as session:
+            yield session
+
+    data = asyncio.run(seed_api_data(session_factory))
+
+    # Redis is not needed: nothing is revoked and every book cache lookup misses
+    monkeypatch.setattr("api.v1.auth.dependency.jti_in_blocklist", AsyncMock(return_value=False))
+    fake_redis = AsyncMock()
+    fake_redis.get.return_value = None
+    monkeypatch.setattr("api.v1.books.cache.redis_client", fake_redis)
+    monkeypatch.setattr("api.v1.auth.cache._principals", {})
+
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides[get_session] = get_sqlite_session
+    app.dependency_overrides[get_read_session] = get_sqlite_session
+    app.dependency_overrides[get_read_session_factory] = lambda: session_factory
+
+    token = create_access_token(user_data={"email": data.email, "user_uid": data.user_uid, "role": "user"})
+    client = TestClient(app, base_url="http://localhost", headers={"Authorization": f"Bearer {token}"})
+
+    yield SimpleNamespace(client=client, session_factory=session_factory, **vars(data))
+
+    app.dependency_overrides.clear()
+    app.dependency_overrides.update(overrides)
+
+
+def query_count(response) -> int:
+    """Reads the query count QueryCounterMiddleware puts in the Server-Timing header"""
+    match = re.search(r'desc="(\d+) queries"', response.headers.get("server-timing", ""))
+    assert match is not None, "response has no db Server-Timing entry"
+    return int(match.group(1))
+
+
+@pytest.fixture
+def assert_query_budget():
+    def check(response, budget: int) -> None:
+        count = query_count(response)
+        assert count <= budget, f"{response.request.method} {response.request.url.path} ran {count} queries, budget is {budget}"
+
+    return check
+
+
+class SMTPSink:
+    """aiosmtpd handler that counts delivered messages and refuses recipients whose address starts with "bounce" """
+
+    def __init__(self):
+        self.received = 0
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("bounce"):
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+
+def free_tcp_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_sink():
+    """A local plaintext SMTP server, skipped when aiosmtpd is not installed"""
+    controller_module = pytest.importorskip("aiosmtpd.controller")
+    port = free_tcp_port()
+    sink = SMTPSink()
+    controller = controller_module.Controller(sink, hostname="127.0.0.1", port=port)
+    controller.start()
+
+    config = ConnectionConfig(
+        MAIL_USERNAME="",
+        MAIL_PASSWORD="",
+        MAIL_PORT=port,
+        MAIL_SERVER="127.0.0.1",
+        MAIL_FROM="test@example.com",
+        MAIL_FROM_NAME="Bookly tests",
+        MAIL_STARTTLS=False,
+        MAIL_SSL_TLS=False,
+        USE_CREDENTIALS=False,
+        VALIDATE_CERTS=False,
+    )
+    yield SimpleNamespace(sink=sink, config=config)
+
+    controller.stop()
@@ -1,4 +1,27 @@
-from api.v1.auth.schema import UserCreateModel
+import asyncio
+import threading
+import time
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from pydantic import ValidationError
+
+from api.v1.auth import celery_send_email, utils as auth_utils
+from api.v1.auth.models import EmailOutbox
+from api.v1.auth.outbox import add_outbox_email, dispatch_outbox
+from api.v1.auth.cache import cache_principal, get_cached_principal, invalidate_principal, cache_verified_token, \
+    get_verified_token
+from api.v1.auth.schema import UserCreateModel, Principal
+from db import rate_limit, redis as redis_blocklist
+from config import Config
+from db.bloom import BloomFilter
+from errors import PasswordHashingBusy
+from metrics import render_metrics
+from mail import load_templates, render_template, template_env
+from sqlmodel import select
 
 auth_prefix = f"/api/v1/auth"
 
@@ -21,4 +44,433 @@ def test_user_creation(fake_session, fake_user_service, test_client):
     assert fake_user_service.user_exists_called_once()
     assert fake_user_service.user_exists_called_once_with(signup_data['email'],fake_session)
     assert fake_user_service.create_user_called_once()
-    assert fake_user_service.create_user_called_once_with(user_data,fake_session)
\ No newline at end of file
+    assert fake_user_service.create_user_called_once_with(user_data,fake_session)
+
+def test_principal_cache_invalidation():
+    principal = Principal(uid=uuid.uuid4(), email="jodestrevin@gmail.com", role="user", is_verified=False)
+    cache_principal(principal)
+
+    assert get_cached_principal(str(principal.uid)) == principal
+
+    invalidate_principal(principal.uid)
+
+    assert get_cached_principal(str(principal.uid)) is None
+
+
+def test_verified_token_cache_drops_expired_tokens():
+    cache_verified_token("live-token", {"jti": "1", "exp": time.time() + 60})
+    cache_verified_token("expired-token", {"jti": "2", "exp": time.time() - 1})
+
+    assert get_verified_token("live-token")["jti"] == "1"
+    assert get_verified_token("expired-token") is None
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    jtis = [str(uuid.uuid4()) for _ in range(1000)]
+
+    for jti in jtis:
+        bloom.add(jti)
+
+    assert all(jti in bloom for jti in jtis)
+
+
+class FakeBlocklistRedis:
+    """Just enough of the Redis client for RevokedJtiFilter, with Celery keys sharing the database"""
+
+    def __init__(self, revoked, fail_after_messages=None):
+        self.revoked = revoked
+        self.fail_after_messages = fail_after_messages
+        self.messages = 0
+        self.scanned = False
+
+    async def exists(self, key):
+        return 1
+
+    async def zremrangebyscore(self, *args):
+        return 0
+
+    async def zscan_iter(self, key, count):
+        for jti in self.revoked:
+            yield jti.encode(), time.time() + 60
+
+    async def scan_iter(self, **kwargs):
+        self.scanned = True
+        for key in [b"celery-task-meta-1", b"unacked", b"_kombu.binding.celery"]:
+            yield key
+
+    def pubsub(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def subscribe(self, channel):
+        pass
+
+    async def get_message(self, ignore_subscribe_messages, timeout):
+        self.messages += 1
+        if self.fail_after_messages is not None and self.messages > self.fail_after_messages:
+            raise TypeError("unexpected message")
+        await asyncio.sleep(0.01)
+
+
+def test_jti_filter_is_rebuilt_from_the_revoked_index_only(monkeypatch):
+    fake_redis = FakeBlocklistRedis(revoked=["revoked-jti"])
+    monkeypatch.setattr(redis_blocklist, "redis_client", fake_redis)
+    jti_filter = redis_blocklist.RevokedJtiFilter(capacity=1000, error_rate=0.01)
+
+    asyncio.run(jti_filter._rebuild())
+
+    assert "revoked-jti" in jti_filter.bloom
+    assert "celery-task-meta-1" not in jti_filter.bloom
+    assert not fake_redis.scanned
+
+
+def test_jti_filter_falls_back_to_redis_when_sync_fails(monkeypatch):
+    fake_redis = FakeBlocklistRedis(revoked=[], fail_after_messages=3)
+    monkeypatch.setattr(redis_blocklist, "redis_client", fake_redis)
+    jti_filter = redis_blocklist.RevokedJtiFilter(capacity=1000, error_rate=0.01)
+
+    async def run():
+        await jti_filter.start()
+        await asyncio.sleep(0.02)
+        ready_while_synced = jti_filter.ready
+        await asyncio.sleep(0.1)  # The sync loop has now hit a non-Redis error
+        ready_after_failure = jti_filter.ready
+        still_running = not jti_filter._task.done()
+        await jti_filter.stop()
+        return ready_while_synced, ready_after_failure, still_running
+
+    assert asyncio.run(run()) == (True, False, True)
+    assert jti_filter.might_contain(str(uuid.uuid4()))
+
+
+def test_jti_blocklist_skips_redis_when_filter_rules_out_jti(monkeypatch):
+    fake_redis = AsyncMock()
+    fake_redis.get.return_value = b""
+    monkeypatch.setattr(redis_blocklist, "redis_client", fake_redis)
+    jti_filter = redis_blocklist.RevokedJtiFilter(capacity=1000, error_rate=0.01)
+    jti_filter.ready = True
+    jti_filter.add("revoked-jti")
+    monkeypatch.setattr(redis_blocklist, "revoked_jti_filter", jti_filter)
+
+    assert asyncio.run(redis_blocklist.jti_in_blocklist(str(uuid.uuid4()))) is False
+    fake_redis.get.assert_not_called()
+
+    assert asyncio.run(redis_blocklist.jti_in_blocklist("revoked-jti")) is True
+    fake_redis.get.assert_called_once_with("revoked-jti")
+
+
+def test_send_mail_only_enqueues_a_job(api_client, monkeypatch):
+    delay = MagicMock(return_value=SimpleNamespace(id="job-1"))
+    monkeypatch.setattr(celery_send_email.send_bulk_email, "delay", delay)
+
+    response = api_client.client.post(f"{auth_prefix}/send-mail", json={"addresses": ["a@example.com", "b@example.com"]})
+
+    assert response.status_code == 202
+    assert response.json()["job_id"] == "job-1"
+    assert delay.call_args.args[0] == ["a@example.com", "b@example.com"]
+
+
+def test_bulk_email_sends_in_batches_and_records_failures(monkeypatch):
+    batches, updates = [], []
+
+    def send_batch(messages):
+        batches.append([message.recipients[0] for message in messages])
+        return [ValueError("refused") if message.recipients[0] == "bad@example.com" else None for message in messages]
+
+    monkeypatch.setattr(celery_send_email, "send_batch_sync", send_batch)
+    monkeypatch.setattr(celery_send_email.send_bulk_email, "update_state", lambda **kwargs: updates.append(dict(kwargs["meta"])))
+    monkeypatch.setattr(Config, "MAIL_BULK_BATCH_SIZE", 2)
+
+    recipients = ["a@example.com", "bad@example.com", "c@example.com", "d@example.com", "e@example.com"]
+    progress = celery_send_email.send_bulk_email(recipients, "Welcome", "welcome.html", {})
+
+    assert batches == [recipients[0:2], recipients[2:4], recipients[4:]]
+    assert progress["sent"] == 4 and progress["failed"] == 1
+    assert progress["failures"] == [{"recipient": "bad@example.com", "error": "refused"}]
+    assert [update["sent"] + update["failed"] for update in updates] == [0, 2, 4, 5]
+
+
+def test_bulk_email_records_a_malformed_address_and_carries_on(monkeypatch):
+    sent = []
+
+    def send_batch(messages):
+        sent.extend(message.recipients[0] for message in messages)
+        return [None] * len(messages)
+
+    monkeypatch.setattr(celery_send_email, "send_batch_sync", send_batch)
+    monkeypatch.setattr(celery_send_email.send_bulk_email, "update_state", lambda **kwargs: None)
+
+    progress = celery_send_email.send_bulk_email.run(["ok@example.com", "not-an-email", "c@example.com"], "Hi",
+                                                     "welcome.html", {})
+
+    assert sent == ["ok@example.com", "c@example.com"]
+    assert progress["sent"] == 2 and progress["failed"] == 1
+    assert [failure["recipient"] for failure in progress["failures"]] == ["not-an-email"]
+
+
+def test_send_mail_rejects_a_malformed_address(api_client, monkeypatch):
+    delay = MagicMock()
+    monkeypatch.setattr(celery_send_email.send_bulk_email, "delay", delay)
+
+    response = api_client.client.post(f"{auth_prefix}/send-mail", json={"addresses": ["a@example.com", "not-an-email"]})
+
+    assert response.status_code == 422
+    delay.assert_not_called()
+
+
+def test_email_tasks_accept_jobs_queued_with_a_rendered_body(monkeypatch):
+    sent = []
+    monkeypatch.setattr(celery_send_email, "send_message_sync", sent.append)
+    monkeypatch.setattr(celery_send_email, "send_batch_sync", lambda messages: sent.extend(messages) or [None] * len(messages))
+    monkeypatch.setattr(celery_send_email.send_bulk_email, "update_state", lambda **kwargs: None)
+
+    celery_send_email.send_email(["a@example.com"], "Hi", "<p>legacy</p>")
+    celery_send_email.send_bulk_email(["b@example.com"], "Hi", "<p>legacy bulk</p>")
+    celery_send_email.send_email(["c@example.com"], "Hi", "welcome.html", {})
+
+    assert [message.body for message in sent[:2]] == ["<p>legacy</p>", "<p>legacy bulk</p>"]
+    assert sent[2].body == render_template("welcome.html", {})
+
+
+async def outbox_rows(session_factory) -> list:
+    async with session_factory() as session:
+        return (await session.exec(select(EmailOutbox).order_by(EmailOutbox.recipient))).all()
+
+
+def test_signup_writes_the_verification_email_to_the_outbox(api_client):
+    response = api_client.client.post(f"{auth_prefix}/signup", json={
+        "username": "reader", "email": "reader@example.com", "first_name": "a", "last_name": "b", "password": "test1234",
+    })
+
+    assert response.status_code == 201
+    [email] = asyncio.run(outbox_rows(api_client.session_factory))
+    assert email.recipient == "reader@example.com"
+    assert email.template == "verify_email.html" and "/api/v1/auth/verify/" in email.context["link"]
+
+
+def test_outbox_dispatch_removes_sent_emails_and_reschedules_failures(api_client):
+    async def queue_emails():
+        async with api_client.session_factory() as session:
+            for recipient in ["a@example.com", "bounce@example.com", "c@example.com"]:
+                add_outbox_email(session, recipient, "Hi", "welcome.html", {})
+            await session.commit()
+
+    batches = []
+
+    async def send(messages):
+        batches.append(len(messages))
+        return [ValueError("550 No such user") if message.recipients[0].startswith("bounce") else None for message in messages]
+
+    asyncio.run(queue_emails())
+    stats = asyncio.run(dispatch_outbox(api_client.session_factory, send, batch_size=2))
+
+    assert stats == {"sent": 2, "failed": 1}
+    assert batches == [2, 1]
+    [failed] = asyncio.run(outbox_rows(api_client.session_factory))
+    assert failed.recipient == "bounce@example.com" and failed.attempts == 1
+    assert failed.next_attempt_at > datetime.now()
+
+    # Not due again until the retry delay has passed
+    assert asyncio.run(dispatch_outbox(api_client.session_factory, send, batch_size=2)) == {"sent": 0, "failed": 0}
+
+
+def test_outbox_parks_a_malformed_recipient_without_holding_up_the_batch(api_client):
+    async def queue_emails():
+        async with api_client.session_factory() as session:
+            add_outbox_email(session, "a@example.com", "Hi", "welcome.html", {})
+            now = datetime.now()
+            # Written directly, as a row queued before recipients were validated would be
+            session.add(EmailOutbox(uid=uuid.uuid4(), recipient="not-an-email", subject="Hi", template="welcome.html",
+                                    context={}, attempts=0, next_attempt_at=now, created_at=now))
+            add_outbox_email(session, "c@example.com", "Hi", "welcome.html", {})
+            await session.commit()
+
+    sent = []
+
+    async def send(messages):
+        sent.extend(message.recipients[0] for message in messages)
+        return [None] * len(messages)
+
+    asyncio.run(queue_emails())
+    stats = asyncio.run(dispatch_outbox(api_client.session_factory, send, batch_size=3))
+
+    assert stats == {"sent": 2, "failed": 1}
+    assert sorted(sent) == ["a@example.com", "c@example.com"]
+    [parked] = asyncio.run(outbox_rows(api_client.session_factory))
+    assert parked.recipient == "not-an-email" and parked.attempts == Config.MAIL_OUTBOX_MAX_ATTEMPTS
+    assert parked.last_error
+
+    assert asyncio.run(dispatch_outbox(api_client.session_factory, send, batch_size=3)) == {"sent": 0, "failed": 0}
+
+
+def test_outbox_reschedules_a_row_whose_template_is_missing(api_client):
+    async def queue_emails():
+        async with api_client.session_factory() as session:
+            add_outbox_email(session, "a@example.com", "Hi", "welcome.html", {})
+            add_outbox_email(session, "b@example.com", "Hi", "no_such_template.html", {})
+            await session.commit()
+
+    async def send(messages):
+        return [None] * len(messages)
+
+    asyncio.run(queue_emails())
+    stats = asyncio.run(dispatch_outbox(api_client.session_factory, send, batch_size=2))
+
+    assert stats == {"sent": 1, "failed": 1}
+    [failed] = asyncio.run(outbox_rows(api_client.session_factory))
+    assert failed.recipient == "b@example.com" and failed.attempts == 1
+    assert "no_such_template.html" in failed.last_error and failed.next_attempt_at > datetime.now()
+
+
+def test_outbox_rejects_a_malformed_recipient(api_client):
+    async def queue_email():
+        async with api_client.session_factory() as session:
+            add_outbox_email(session, "not-an-email", "Hi", "welcome.html", {})
+
+    with pytest.raises(ValidationError):
+        asyncio.run(queue_email())
+
+
+def test_email_templates_are_compiled_once_and_escaped(monkeypatch):
+    load_templates()
+    # Rendering must now come from the compiled cache alone, without reading or stat-ing the files
+    monkeypatch.setattr(template_env.loader, "get_source", MagicMock(side_effect=AssertionError("template reloaded")))
+
+    html = render_template("verify_email.html", {"link": 'https://example.com/verify?a=1&b="2"'})
+
+    assert 'href="https://example.com/verify?a=1&amp;b=&#34;2&#34;"' in html
+    assert "<h1>Verify your Email</h1>" in html
+
+
+class FakeTokenBuckets:
+    """Stands in for the Lua script: a token bucket per key that never refills"""
+
+    def __init__(self):
+        self.calls = 0
+        self.tokens = {}
+
+    async def __call__(self, keys, args):
+        self.calls += 1
+        capacity, per_second = args
+        tokens = self.tokens.get(keys[0], capacity)
+        if tokens >= 1:
+            self.tokens[keys[0]] = tokens - 1
+            return [1, "0"]
+        return [0, str(1 / per_second)]
+
+
+def test_login_is_rate_limited_per_account(api_client, monkeypatch):
+    buckets = FakeTokenBuckets()
+    limiter = rate_limit.RateLimiter(max_local_keys=100)
+    monkeypatch.setattr(limiter, "_take_token", buckets)
+    monkeypatch.setattr("api.v1.auth.dependency.rate_limiter", limiter)
+
+    def login(email, password):
+        return api_client.client.post(f"{auth_prefix}/login", json={"email": email, "password": password})
+
+    assert [login(api_client.email, "wrong-password").status_code for _ in range(5)] == [401] * 5
+
+    response = login(api_client.email.upper(), "test1234")  # Same account, however it is spelled
+    assert response.status_code == 429
+    assert response.json()["error_code"] == "rate_limited"
+    assert 0 < int(response.headers["retry-after"]) <= 60
+
+    # The empty bucket is now known locally, so further attempts are refused without asking Redis
+    calls = buckets.calls
+    assert login(api_client.email, "test1234").status_code == 429
+    assert buckets.calls == calls
+
+    # Refusals by the account bucket spent none of the IP's tokens, and no key holds the raw address
+    [ip_key] = [key for key in buckets.tokens if ":ip:" in key]
+    assert buckets.tokens[ip_key] == rate_limit.parse_rate(Config.RATE_LIMIT_LOGIN_PER_IP).capacity - 5
+    assert not any(api_client.email.lower() in key for key in buckets.tokens)
+
+
+def test_rate_limit_account_key_has_a_fixed_size(api_client, monkeypatch):
+    buckets = FakeTokenBuckets()
+    limiter = rate_limit.RateLimiter(max_local_keys=100)
+    monkeypatch.setattr(limiter, "_take_token", buckets)
+    monkeypatch.setattr("api.v1.auth.dependency.rate_limiter", limiter)
+
+    api_client.client.post(f"{auth_prefix}/login", json={"email": "a" * 100_000, "password": "test1234"})
+
+    [account_key] = [key for key in buckets.tokens if ":account:" in key]
+    assert len(account_key) < 200
+
+
+def test_rate_limit_fails_open_without_redis(monkeypatch):
+    limiter = rate_limit.RateLimiter(max_local_keys=100)
+    monkeypatch.setattr(limiter, "_take_token", AsyncMock(side_effect=redis_blocklist.RedisError("down")))
+
+    assert asyncio.run(limiter.take("login", "login:ip:127.0.0.1", rate_limit.parse_rate("1/minute"))) == 0
+
+
+def test_password_hash_pool_counts_successes_and_failures(monkeypatch):
+    monkeypatch.setattr(auth_utils, "password_hash_stats", {"in_flight": 0, "completed": 0, "failed": 0, "rejected": 0})
+
+    def broken_hash(password):
+        raise ValueError("bad hash")
+
+    asyncio.run(auth_utils.run_in_password_hash_pool(len, "secret"))
+    with pytest.raises(ValueError):
+        asyncio.run(auth_utils.run_in_password_hash_pool(broken_hash, "secret"))
+
+    assert auth_utils.get_password_hash_stats()["completed"] == 1
+    assert auth_utils.get_password_hash_stats()["failed"] == 1
+    assert auth_utils.get_password_hash_stats()["in_flight"] == 0
+    assert "password_hash_failed_total 1" in render_metrics()
+
+
+def test_password_hash_pool_counts_a_cancelled_call_until_its_thread_finishes(monkeypatch):
+    stats = {"in_flight": 0, "completed": 0, "failed": 0, "rejected": 0}
+    monkeypatch.setattr(auth_utils, "password_hash_stats", stats)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_hash(password):
+        started.set()
+        release.wait(5)
+        return password
+
+    async def cancel_while_hashing():
+        task = asyncio.create_task(auth_utils.run_in_password_hash_pool(slow_hash, "secret"))
+        await asyncio.to_thread(started.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        in_flight_after_cancel = stats["in_flight"]
+
+        release.set()
+        while stats["in_flight"]:
+            await asyncio.sleep(0.01)
+        return in_flight_after_cancel
+
+    assert asyncio.run(cancel_while_hashing()) == 1  # bcrypt still runs, so the slot is still taken
+    assert stats["completed"] == 1
+
+
+def test_password_hash_pool_rejects_when_saturated(monkeypatch):
+    stats = {"in_flight": Config.PASSWORD_HASH_MAX_PENDING, "completed": 0, "failed": 0, "rejected": 0}
+    monkeypatch.setattr(auth_utils, "password_hash_stats", stats)
+
+    with pytest.raises(PasswordHashingBusy):
+        asyncio.run(auth_utils.verify_password_async("test1234", "hash"))
+
+    assert stats["rejected"] == 1 and stats["completed"] == 0
+    assert auth_utils.get_password_hash_stats()["queued"] == Config.PASSWORD_HASH_MAX_PENDING - Config.PASSWORD_HASH_WORKERS
+    assert "password_hash_rejected_total 1" in render_metrics()
+
+
+def test_login_answers_503_when_password_hashing_is_saturated(api_client, monkeypatch):
+    monkeypatch.setattr(auth_utils, "password_hash_stats", {"in_flight": Config.PASSWORD_HASH_MAX_PENDING, "completed": 0, "failed": 0, "rejected": 0})
+    monkeypatch.setattr(Config, "RATE_LIMIT_ENABLED", False)
+
+    response = api_client.client.post(f"{auth_prefix}/login", json={"email": api_client.email, "password": "test1234"})
+
+    assert response.status_code == 503
+    assert response.json()["error_code"] == "password_hashing_busy"
@@ -1,4 +1,29 @@
-from api.v1.books.schema import BookCreateModel
+import asyncio
+import gzip
+import json
+import os
+import uuid
+import zlib
+from datetime import datetime
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy import Float, cast, event, update
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from api.v1.auth.models import User
+from api.v1.books import cache
+from api.v1.books.export import export_books
+from api.v1.books.models import Book
+from api.v1.books.schema import BookCreateModel, BookDetailModel, BookUpdateModel
+from api.v1.books.service import BookService
+from api.v1.reviews.schema import ReviewCreateModel
+from errors import InvalidCursor
+from pagination import encode_cursor, decode_cursor, encode_rank_cursor, decode_rank_cursor, encode_rating_cursor, \
+    decode_rating_cursor
 
 books_prefix = f"/api/v1/books"
 
@@ -42,4 +67,406 @@ def test_update_book_by_uid(test_client, fake_book_service, test_book, fake_sess
     response = test_client.put(f"{books_prefix}/{test_book.uid}")
 
     assert fake_book_service.get_book_called_once()
-    assert fake_book_service.get_book_called_once_with(test_book.uid, fake_session)
\ No newline at end of file
+    assert fake_book_service.get_book_called_once_with(test_book.uid, fake_session)
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2025, 2, 23, 2, 28, 1, 284106)
+    uid = uuid.uuid4()
+
+    cursor = encode_cursor(created_at, uid)
+
+    assert decode_cursor(cursor) == (created_at, uid)
+
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(InvalidCursor):
+        decode_cursor("not-a-cursor")
+
+
+def test_rank_cursor_round_trip():
+    uid = uuid.uuid4()
+
+    cursor = encode_rank_cursor(0.0607927, uid)
+
+    assert decode_rank_cursor(cursor) == (0.0607927, uid)
+
+
+def test_rating_cursor_keeps_the_rating_an_int():
+    uid = uuid.uuid4()
+
+    rating, decoded_uid = decode_rating_cursor(encode_rating_cursor(4, uid))
+
+    assert (rating, decoded_uid) == (4, uid) and type(rating) is int
+    with pytest.raises(InvalidCursor):
+        decode_rating_cursor(encode_rank_cursor(4.5, uid))
+
+
+def test_get_book_detail_served_from_cache(monkeypatch, fake_session):
+    book = BookDetailModel(
+        uid=uuid.uuid4(),
+        title="sample title",
+        author="sample author",
+        publisher="sample publisher",
+        published_date=datetime.now().date(),
+        page_count=200,
+        language="English",
+        created_at=datetime.now(),
+        updated_at=datetime.now()
+    )
+    fake_redis = AsyncMock()
+    fake_redis.get.return_value = book.model_dump_json()
+    monkeypatch.setattr(cache, "redis_client", fake_redis)
+    get_book = AsyncMock()
+    monkeypatch.setattr(BookService, "get_book", get_book)
+
+    result = asyncio.run(BookService().get_book_detail(str(book.uid), fake_session))
+
+    assert result == book
+    fake_redis.get.assert_called_once_with(f"book:{book.uid}")
+    get_book.assert_not_called()
+
+
+async def update_and_delete_counting_queries(engine) -> dict:
+    statements = []
+    event.listen(engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    book_uid = uuid.uuid4()
+    update_data = BookUpdateModel(title="New Title", author="New Author", publisher="New Publisher", page_count=300, language="French")
+
+    async with session_factory() as session:
+        session.add(Book(uid=book_uid, title="Old Title", author="Old Author", publisher="Old Publisher", published_date=datetime.now().date(),
+                         page_count=200, language="English", created_at=datetime.now(), updated_at=datetime.now()))
+        await session.commit()
+
+    counts = {}
+    async with session_factory() as session:
+        statements.clear()
+        updated_book = await BookService.update_book(book_uid, update_data, session)
+        counts["update"] = len(statements)
+        counts["updated_title"] = updated_book.title
+
+        statements.clear()
+        counts["deleted"] = await BookService.delete_book(book_uid, session)
+        counts["delete"] = len(statements)
+
+        statements.clear()
+        counts["missing"] = await BookService.update_book(book_uid, update_data, session)
+        counts["update_missing"] = len(statements)
+
+    await engine.dispose()
+    return counts
+
+
+def test_update_takes_two_queries_and_delete_one(sqlite_engine, monkeypatch):
+    monkeypatch.setattr("api.v1.books.service.invalidate_book", AsyncMock())
+
+    counts = asyncio.run(update_and_delete_counting_queries(sqlite_engine))
+
+    assert counts["update"] == 2  # UPDATE ... RETURNING, then the newest reviews for the response
+    assert counts["updated_title"] == "New Title"
+    assert counts["delete"] == 1
+    assert counts["deleted"] is True
+    assert counts["missing"] is None
+    assert counts["update_missing"] == 1
+
+
+async def backfill_rating_stats(session_factory) -> None:
+    last_uid = None
+    async with session_factory() as session:
+        while True:
+            last_uid = await BookService.recompute_rating_stats(last_uid, 1, session)
+            if last_uid is None:
+                break
+
+
+def test_rating_stats_backfill_and_review_increment(api_client):
+    client = api_client.client
+    asyncio.run(backfill_rating_stats(api_client.session_factory))  # The seeded book has three reviews rated 4
+
+    cache.redis_client.delete.assert_any_await(f"book:{api_client.book_uid}")  # The stale cached detail is dropped
+
+    book = client.get(f"/api/v1/books/{api_client.book_uid}").json()
+    assert book["review_count"] == 3
+    assert book["average_rating"] == 4.0
+    assert book["rating_histogram"] == [0, 0, 0, 0, 3]
+
+    unrated = client.post("/api/v1/books/", json={"title": "Unrated", "author": "Author", "publisher": "Publisher",
+                                                  "published_date": "2024-12-10", "page_count": 100, "language": "English"}).json()
+    assert unrated["review_count"] == 0
+    assert unrated["average_rating"] is None
+
+    response = client.post(f"/api/v1/reviews/book/{api_client.book_uid}", json={"rating": 2, "review_text": "Less good"})
+    assert response.status_code == 201
+
+    book = client.get(f"/api/v1/books/{api_client.book_uid}").json()
+    assert book["review_count"] == 4
+    assert book["average_rating"] == 3.5
+    assert book["rating_histogram"] == [0, 0, 1, 0, 3]
+
+    first_page = client.get("/api/v1/books/", params={"sort": "rating", "limit": 1}).json()
+    assert [item["uid"] for item in first_page["items"]] == [api_client.book_uid]
+    second_page = client.get("/api/v1/books/", params={"sort": "rating", "limit": 1, "cursor": first_page["next_cursor"]}).json()
+    assert [item["uid"] for item in second_page["items"]] == [unrated["uid"]]
+    assert second_page["next_cursor"] is None
+
+
+def test_review_rating_must_be_in_histogram_range():
+    with pytest.raises(ValueError):
+        ReviewCreateModel(rating=-1, review_text="Negative")
+
+
+async def make_admin(session_factory, user_uid: str) -> None:
+    async with session_factory() as session:
+        await session.exec(update(User).where(User.uid == uuid.UUID(user_uid)).values(role="admin"))
+        await session.commit()
+
+
+def test_bulk_import_ndjson_reports_rejected_rows(api_client, monkeypatch):
+    monkeypatch.setattr("config.Config.BOOK_IMPORT_BATCH_SIZE", 2)
+    asyncio.run(make_admin(api_client.session_factory, api_client.user_uid))
+    book = {"title": "Imported", "author": "Author", "publisher": "Publisher", "published_date": "2024-12-10",
+            "page_count": 120, "language": "English"}
+    lines = [json.dumps(book), json.dumps({**book, "page_count": "many"}), "", "not json", json.dumps(book), json.dumps(book)]
+
+    response = api_client.client.post("/api/v1/books/import", content="\n".join(lines),
+                                      headers={"content-type": "application/x-ndjson"})
+
+    assert response.status_code == 200
+    result = response.json()
+    assert result["imported"] == 3
+    assert result["rejected"] == 2
+    assert [error["line"] for error in result["errors"]] == [2, 4]
+    assert result["errors"][0]["errors"][0].startswith("page_count")
+
+    books = api_client.client.get(f"/api/v1/books/user/{api_client.user_uid}", params={"limit": 10}).json()["items"]
+    assert sum(book["title"] == "Imported" for book in books) == 3
+
+
+def test_bulk_import_csv_streamed_in_uneven_chunks(api_client):
+    asyncio.run(make_admin(api_client.session_factory, api_client.user_uid))
+    body = ('title,author,publisher,published_date,page_count,language\r\n'
+            '"Dune, Part One",Frank Herbert,Chilton,1965-08-01,412,English\r\n'
+            '"A ""quoted""\nmultiline title",Ünïcode Äuthor,Press,2001-01-01,99,Deutsch\r\n'
+            'Short row,only two\r\n').encode()
+
+    def chunks():
+        for start in range(0, len(body), 7):  # Splits multi-byte characters and CRLFs across chunks
+            yield body[start:start + 7]
+
+    response = api_client.client.post("/api/v1/books/import", content=chunks(), headers={"content-type": "text/csv; charset=utf-8"})
+
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["imported"], result["rejected"]) == (2, 1)
+    assert result["errors"][0]["line"] == 5
+
+    books = api_client.client.get(f"/api/v1/books/user/{api_client.user_uid}", params={"limit": 10}).json()["items"]
+    assert {"Dune, Part One", 'A "quoted"\nmultiline title'} <= {book["title"] for book in books}
+    assert "Ünïcode Äuthor" in {book["author"] for book in books}
+
+
+def test_bulk_import_csv_rejects_a_runaway_quoted_field(api_client, monkeypatch):
+    monkeypatch.setattr("config.Config.BOOK_IMPORT_MAX_RECORD_LINES", 3)
+    asyncio.run(make_admin(api_client.session_factory, api_client.user_uid))
+    row = "Title,Author,Press,2001-01-01,99,English"
+    body = "\n".join(["title,author,publisher,published_date,page_count,language", row,
+                      '"Stray quote,Author,Press,2001-01-01,99,English', row, row, row])
+
+    response = api_client.client.post("/api/v1/books/import", content=body, headers={"content-type": "text/csv"})
+
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["imported"], result["rejected"]) == (2, 1)
+    assert result["errors"] == [{"line": 3, "errors": ["Record starting on line 3 has an unterminated quoted field"]}]
+
+
+def test_bulk_import_rejects_other_content_types(api_client):
+    asyncio.run(make_admin(api_client.session_factory, api_client.user_uid))
+
+    response = api_client.client.post("/api/v1/books/import", content="{}", headers={"content-type": "application/json"})
+
+    assert response.status_code == 415
+
+
+def create_books(client, count: int) -> None:
+    for n in range(count):
+        client.post("/api/v1/books/", json={"title": f"Exported {n}", "author": "Author", "publisher": "Publisher",
+                                            "published_date": "2024-12-10", "page_count": 100, "language": "English"})
+
+
+def test_export_streams_ndjson_and_resumes(api_client, monkeypatch):
+    monkeypatch.setattr("config.Config.BOOK_EXPORT_CHUNK_SIZE", 2)
+    client = api_client.client
+    create_books(client, 4)
+
+    response = client.get("/api/v1/books/export", headers={"accept-encoding": "identity"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "content-encoding" not in response.headers
+    books = [json.loads(line) for line in response.text.splitlines()]
+    assert [book["title"] for book in books] == ["sample title"] + [f"Exported {n}" for n in range(4)]
+
+    resumed = client.get("/api/v1/books/export", params={"cursor": books[2]["cursor"]}, headers={"accept-encoding": "identity"})
+    assert [json.loads(line)["uid"] for line in resumed.text.splitlines()] == [book["uid"] for book in books[3:]]
+
+
+def test_export_resumes_after_a_deleted_book(api_client):
+    client = api_client.client
+    create_books(client, 2)
+    books = [json.loads(line) for line in client.get("/api/v1/books/export").text.splitlines()]
+
+    assert client.delete(f"/api/v1/books/{books[1]['uid']}").status_code == 204
+    resumed = client.get("/api/v1/books/export", params={"cursor": books[1]["cursor"]})
+
+    assert resumed.status_code == 200
+    assert [json.loads(line)["uid"] for line in resumed.text.splitlines()] == [books[2]["uid"]]
+
+
+async def collect_export_chunks(session_factory) -> list:
+    return [chunk async for chunk in export_books(session_factory, compress=True)]
+
+
+def test_export_gzip_decompresses_per_chunk(api_client, monkeypatch):
+    monkeypatch.setattr("config.Config.BOOK_EXPORT_CHUNK_SIZE", 2)
+    client = api_client.client
+    create_books(client, 3)
+
+    with client.stream("GET", "/api/v1/books/export", headers={"accept-encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        raw = b"".join(response.iter_raw())
+    assert len(gzip.decompress(raw).splitlines()) == 4
+
+    # Every chunk ends on a flush point and a line boundary, so a download cut after any chunk is usable
+    decompressor = zlib.decompressobj(wbits=31)
+    chunks = asyncio.run(collect_export_chunks(api_client.session_factory))
+    decoded = [decompressor.decompress(chunk) for chunk in chunks[:-1]]
+    assert len(decoded) == 2
+    assert all(part.endswith(b"\n") and len(part.splitlines()) == 2 for part in decoded)
+
+
+def test_export_rejects_a_malformed_cursor(api_client):
+    response = api_client.client.get("/api/v1/books/export", params={"cursor": "not-a-cursor"})
+
+    assert response.status_code == 400
+
+
+def test_invalidate_book_keeps_the_delayed_delete_alive(monkeypatch):
+    fake_redis = AsyncMock()
+    monkeypatch.setattr(cache, "redis_client", fake_redis)
+    monkeypatch.setattr(cache, "replica_engines", [object()])
+    monkeypatch.setattr("config.Config.DB_REPLICA_LAG_WINDOW", 0)
+
+    async def invalidate():
+        await cache.invalidate_book(str(uuid.uuid4()))
+
+        release = asyncio.Event()
+
+        async def slow_delete(key):
+            await release.wait()
+
+        fake_redis.delete.side_effect = slow_delete
+        await asyncio.sleep(0.01)  # Lets call_later fire; the delayed delete is now waiting on Redis
+        pending = len(cache._pending_deletes)
+
+        release.set()
+        await asyncio.gather(*cache._pending_deletes)
+        return pending
+
+    assert asyncio.run(invalidate()) == 1
+    assert fake_redis.delete.await_count == 2
+    assert not cache._pending_deletes
+
+
+def test_patch_response_includes_the_books_reviews(api_client):
+    response = api_client.client.patch(f"/api/v1/books/{api_client.book_uid}", json={"title": "Renamed", "author": "Author", "publisher": "Publisher",
+                                                                                         "page_count": 215, "language": "English"})
+
+    assert response.status_code == 200
+    assert response.json()["title"] == "Renamed"
+    assert len(response.json()["reviews"]) == 3
+
+
+def test_update_returns_only_the_newest_reviews(api_client, monkeypatch):
+    monkeypatch.setattr("api.v1.books.service.invalidate_book", AsyncMock())
+    update_data = BookUpdateModel(title="Renamed", author="Author", publisher="Publisher", page_count=215, language="English")
+
+    async def update_book():
+        async with api_client.session_factory() as session:
+            return await BookService.update_book(api_client.book_uid, update_data, session, review_limit=2)
+
+    book = asyncio.run(update_book())
+
+    assert book.title == "Renamed"
+    assert len(book.reviews) == 2
+
+
+@pytest.mark.parametrize("params", [{}, {"q": ""}, {"q": "x" * 201}])
+def test_search_rejects_a_missing_empty_or_overlong_query(api_client, params):
+    response = api_client.client.get(f"{books_prefix}/search", params=params)
+
+    assert response.status_code == 422
+
+
+def test_search_passes_the_query_and_page_to_the_service(api_client, monkeypatch):
+    search_books = AsyncMock(return_value={"items": [], "next_cursor": None})
+    monkeypatch.setattr("api.v1.books.routes.book_service.search_books", search_books)
+
+    response = api_client.client.get(f"{books_prefix}/search", params={"q": "dune herbert", "limit": 5})
+
+    assert response.status_code == 200
+    assert response.json() == {"items": [], "next_cursor": None}
+    query, _, cursor, limit = search_books.await_args.args
+    assert (query, cursor, limit) == ("dune herbert", None, 5)
+
+
+async def ranked_pages(session_factory, limit: int) -> list:
+    # page_count stands in for the full-text rank, which only Postgres can compute
+    rank = cast(Book.page_count, Float).label("rank")
+    pages, cursor = [], None
+    async with session_factory() as session:
+        while True:
+            page = await BookService.paginate_ranked(select(Book, rank), rank, cursor, limit, session)
+            pages.append([book.page_count for book in page["items"]])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages
+
+
+def test_ranked_pages_are_best_match_first_without_gaps_or_repeats(api_client):
+    for page_count in (120, 450, 300, 450):
+        api_client.client.post(f"{books_prefix}/", json={"title": "Ranked", "author": "Author", "publisher": "Publisher",
+                                                         "published_date": "2024-12-10", "page_count": page_count, "language": "English"})
+
+    pages = asyncio.run(ranked_pages(api_client.session_factory, limit=2))
+
+    assert pages == [[450, 450], [300, 200], [120]]
+
+
+@pytest.mark.skipif(not os.environ.get("TEST_POSTGRES_URL"), reason="set TEST_POSTGRES_URL to run full-text search on Postgres")
+def test_search_ranks_title_matches_first_on_postgres():
+    async def search() -> list:
+        engine = create_async_engine(os.environ["TEST_POSTGRES_URL"])
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        try:
+            async with session_factory() as session:
+                now = datetime.now()
+                for title, author in [("Dune", "Frank Herbert"), ("Children of Dune", "Frank Herbert"), ("Emma", "Jane Austen")]:
+                    session.add(Book(uid=uuid.uuid4(), title=title, author=author, publisher="Chilton", published_date=now.date(),
+                                     page_count=100, language="English", created_at=now, updated_at=now))
+                await session.commit()
+
+                page = await BookService().search_books("dune", session)
+                return [book.title for book in page["items"]]
+        finally:
+            async with engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.drop_all)
+            await engine.dispose()
+
+    titles = asyncio.run(search())
+
+    assert titles[0] == "Dune"
+    assert set(titles) == {"Dune", "Children of Dune"}
@@ -0,0 +1,147 @@
+import asyncio
+import time
+from collections import deque
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.requests import Request
+
+from config import Config
+from db import db, slow_queries
+from db.db import QueryStats, instrument_engine, request_query_stats
+
+
+def make_request(headers: dict = None) -> Request:
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/api/v1/books/",
+        "headers": [(k.encode(), v.encode()) for k, v in (headers or {}).items()],
+    }
+    return Request(scope)
+
+
+async def read_database_name(request: Request) -> str:
+    sessions = db.get_read_session(request)
+    session = await anext(sessions)
+    try:
+        result = await session.exec(text("SELECT name FROM database_name"))
+        return result.scalar_one()
+    finally:
+        await sessions.aclose()
+
+
+async def route_reads(tmp_path, monkeypatch) -> dict:
+    engines = {}
+    for name in ("primary", "replica"):
+        engines[name] = db.create_engine(f"sqlite+aiosqlite:///{tmp_path}/{name}.db")
+        async with engines[name].begin() as conn:
+            await conn.execute(text("CREATE TABLE database_name (name TEXT)"))
+            await conn.execute(text("INSERT INTO database_name VALUES (:name)"), {"name": name})
+
+    monkeypatch.setattr(db, "async_session", db.make_session_factory(engines["primary"]))
+    monkeypatch.setattr(db, "replica_engines", [engines["replica"]])
+    monkeypatch.setattr(db, "replica_sessions", [db.make_session_factory(engines["replica"])])
+
+    try:
+        return {
+            "read": await read_database_name(make_request()),
+            "read_after_write": await read_database_name(make_request({db.READ_PRIMARY_HEADER: str(time.time() + 5)})),
+            "read_after_window": await read_database_name(make_request({db.READ_PRIMARY_HEADER: str(time.time() - 1)})),
+        }
+    finally:
+        for engine in engines.values():
+            await engine.dispose()
+
+
+def test_reads_go_to_replica_outside_read_your_writes_window(tmp_path, monkeypatch):
+    routed = asyncio.run(route_reads(tmp_path, monkeypatch))
+
+    assert routed["read"] == "replica"
+    assert routed["read_after_write"] == "primary"
+    assert routed["read_after_window"] == "replica"
+
+
+async def run_slow_query(tmp_path) -> None:
+    engine = db.create_engine(f"sqlite+aiosqlite:///{tmp_path}/slow.db")
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT :email AS email"), {"email": "jodestrevin@gmail.com"})
+    finally:
+        await engine.dispose()
+
+
+def test_slow_query_is_logged_with_redacted_parameters(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "DB_SLOW_QUERY_MS", 0.000001)
+    monkeypatch.setattr(slow_queries, "slow_query_log", deque(maxlen=10))
+
+    asyncio.run(run_slow_query(tmp_path))
+
+    entry = next(entry for entry in slow_queries.get_slow_queries() if "AS email" in entry["statement"])
+    assert entry["parameters"] == ["<str>"]
+    assert "jodestrevin" not in str(entry)
+    assert entry["plan"] is None  # Plans are only captured on Postgres
+
+
+async def run_failing_then_passing_statement(engine) -> list:
+    async with engine.connect() as conn:
+        with pytest.raises(Exception):
+            await conn.exec_driver_sql("SELECT * FROM no_such_table")
+        await conn.rollback()
+        await conn.exec_driver_sql("SELECT 1")
+        leftover = conn.sync_connection.info.get("query_start_time")
+    await engine.dispose()
+    return leftover
+
+
+def test_failed_statement_leaves_no_start_time_on_the_connection(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/failing.db")
+    instrument_engine(engine)
+    stats = QueryStats()
+    token = request_query_stats.set(stats)
+    try:
+        leftover = asyncio.run(run_failing_then_passing_statement(engine))
+    finally:
+        request_query_stats.reset(token)
+
+    assert leftover is None
+    assert stats.count == 1  # Only the statement that completed is counted
+
+
+async def check_out_connections(engine, times: int) -> None:
+    for _ in range(times):
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+
+def test_pool_stats_are_kept_per_engine(tmp_path):
+    engines = {name: db.create_engine(f"sqlite+aiosqlite:///{tmp_path}/{name}.db", name) for name in ("stats-a", "stats-b")}
+
+    async def run():
+        await check_out_connections(engines["stats-a"], 2)
+        await check_out_connections(engines["stats-b"], 1)
+        stats = {name: db.get_pool_stats(engine.pool) for name, engine in engines.items()}
+        for engine in engines.values():
+            await engine.dispose()
+        return stats
+
+    stats = asyncio.run(run())
+
+    assert stats["stats-a"]["checkouts"] == 2
+    assert stats["stats-b"]["checkouts"] == 1
+    assert engines["stats-a"].pool.engine_name == "stats-a"  # Kept across dispose(), which swaps in a new pool
+
+
+@pytest.mark.parametrize("statement, explainable", [
+    ("SELECT * FROM books WHERE uid = $1", True),
+    ("  select uid from books", True),
+    ("SELECT * FROM books WHERE uid = $1 FOR UPDATE", False),
+    ("SELECT * FROM email_outbox LIMIT 10 FOR UPDATE SKIP LOCKED", False),
+    ("SELECT * FROM books FOR SHARE", False),
+    ("SELECT * FROM books\nFOR NO KEY UPDATE", False),
+    ("SELECT * FROM books for key share", False),
+    ("UPDATE books SET title = $1", False),
+])
+def test_only_plain_selects_are_explained(statement, explainable):
+    assert slow_queries.is_explainable(statement) is explainable
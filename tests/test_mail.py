@@ -0,0 +1,41 @@
+import asyncio
+
+from mail import SMTPConnectionPool, create_message
+
+
+async def send_messages(pool: SMTPConnectionPool, count: int) -> None:
+    for n in range(count):
+        await pool.send(create_message(recipients=["reader@example.com"], subject=f"Message {n}", body="<p>Hi</p>"))
+
+
+async def send_across_dropped_connection(pool: SMTPConnectionPool) -> None:
+    await send_messages(pool, 3)
+
+    smtp, _ = pool._idle[0]
+    smtp.transport.abort()  # The server side going away without a QUIT
+    await asyncio.sleep(0.05)
+    await send_messages(pool, 2)
+
+    pool.max_idle = -1  # Force the NOOP health check on the next checkout
+    await send_messages(pool, 1)
+    await pool.close()
+
+
+def test_smtp_pool_reuses_and_replaces_connections(smtp_sink):
+    pool = SMTPConnectionPool(smtp_sink.config, size=1, max_idle=60)
+    asyncio.run(send_across_dropped_connection(pool))
+
+    assert smtp_sink.sink.received == 6
+    assert pool.stats["sent"] == 6
+    assert pool.stats["connects"] == 2  # One at the start, one after the drop
+
+
+def test_smtp_pool_sends_a_batch_over_one_connection(smtp_sink):
+    pool = SMTPConnectionPool(smtp_sink.config, size=1, max_idle=60)
+    recipients = ["a@example.com", "bounce@example.com", "c@example.com"]
+
+    results = asyncio.run(pool.send_batch([create_message(recipients=[r], subject="Hi", body="<p>Hi</p>") for r in recipients]))
+
+    assert [error is None for error in results] == [True, False, True]
+    assert smtp_sink.sink.received == 2
+    assert pool.stats["connects"] == 1  # The refused recipient did not cost the session
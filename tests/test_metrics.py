@@ -0,0 +1,28 @@
+import metrics
+from metrics import Histogram, render_metrics
+
+
+def test_histogram_buckets_are_cumulative(monkeypatch):
+    monkeypatch.setattr(metrics, "_metrics", [])  # A throwaway registry, so the test metric never reaches /metrics
+    histogram = Histogram("test_latency_seconds", "test latency", ("route",), buckets=(0.1, 1.0))
+
+    histogram.observe(0.05, "/books")
+    histogram.observe(0.5, "/books")
+    histogram.observe(5.0, "/books")
+
+    lines = histogram.collect()
+    assert 'test_latency_seconds_bucket{route="/books",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{route="/books",le="1.0"} 2' in lines
+    assert 'test_latency_seconds_bucket{route="/books",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_count{route="/books"} 3' in lines
+
+
+def test_metrics_endpoint_reports_routes(test_client):
+    test_client.get("/", headers={"host": "localhost"})
+
+    response = test_client.get("/metrics", headers={"host": "localhost"})
+
+    assert response.status_code == 200
+    assert 'http_requests_total{method="GET",route="/",status="200"}' in response.text
+    assert "db_pool_checked_out" in render_metrics()
+    assert "test_latency_seconds" not in render_metrics()
@@ -0,0 +1,27 @@
+import logging
+
+from middleware import access_logger
+
+
+class RecordCollector(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_access_log_records_request(test_client):
+    collector = RecordCollector()
+    access_logger.addHandler(collector)
+
+    try:
+        response = test_client.get("/", headers={"host": "localhost"})
+    finally:
+        access_logger.removeHandler(collector)
+
+    assert response.status_code == 200
+    assert len(collector.records) == 1
+    assert collector.records[0].msg["path"] == "/"
+    assert collector.records[0].msg["status"] == 200
@@ -0,0 +1,123 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from sqlalchemy import event, update
+
+from api.v1.auth.models import User
+from api.v1.auth.utils import create_access_token, create_url_safe_token
+
+postgres_only = pytest.mark.skip(reason="full-text search needs Postgres, the SQLite test database has no tsvector")
+
+# Queries each route may run for one request, principal lookup included. Lower these as routes get
+# cheaper; a test failing here means a change added queries to the route.
+ROUTE_QUERY_BUDGETS = [
+    ("GET", "/api/v1/books/", None, 2),
+    ("GET", "/api/v1/books/user/{user_uid}", None, 2),
+    pytest.param("GET", "/api/v1/books/search?q=sample", None, 2, marks=postgres_only),
+    ("GET", "/api/v1/books/{book_uid}", None, 3),
+    ("GET", "/api/v1/books/{book_uid}?review_limit=2", None, 3),
+    ("GET", "/api/v1/books/{book_uid}/user/{user_uid}", None, 3),
+    ("POST", "/api/v1/books/", {"title": "Sample", "author": "Author", "publisher": "Publisher",
+                                "published_date": "2024-12-10", "page_count": 215, "language": "English"}, 2),
+    ("PATCH", "/api/v1/books/{book_uid}", {"title": "Updated", "author": "Author", "publisher": "Publisher",
+                                           "page_count": 215, "language": "English"}, 3),
+    ("DELETE", "/api/v1/books/{book_uid}", None, 2),
+    ("POST", "/api/v1/reviews/book/{book_uid}", {"rating": 4, "review_text": "Great read"}, 3),
+    ("GET", "/api/v1/reviews/book/{book_uid}", None, 2),
+    ("GET", "/api/v1/auth/user", None, 5),
+    ("POST", "/api/v1/auth/login", {"email": "{email}", "password": "{password}"}, 4),
+    # The existence check, then the user and its outbox email written in one commit
+    ("POST", "/api/v1/auth/signup", {"username": "reader", "email": "reader@example.com", "first_name": "a",
+                                     "last_name": "b", "password": "test1234"}, 3),
+    ("GET", "/api/v1/auth/verify/{verify_token}", None, 4),
+    ("POST", "/api/v1/auth/password-reset", {"email": "{email}"}, 1),
+    ("POST", "/api/v1/auth/password-reset-confirm/{verify_token}", {"new_password": "new12345",
+                                                                     "confirm_password": "new12345"}, 5),
+    ("POST", "/api/v1/auth/logout", None, 0),
+    ("POST", "/api/v1/auth/send-mail", {"addresses": ["a@example.com", "b@example.com"]}, 0),
+    ("GET", "/api/v1/auth/send-mail/job-1", None, 0),
+]
+
+# Routes only an admin may call; the principal lookup is the whole budget
+ADMIN_ROUTE_QUERY_BUDGETS = [
+    ("GET", "/api/v1/books/cache/stats", 1),
+    ("GET", "/api/v1/auth/password-hash/stats", 1),
+    ("GET", "/api/v1/admin/slow-queries", 1),
+]
+
+
+@pytest.fixture
+def budget_client(api_client, monkeypatch):
+    """api_client with the routes' Redis and Celery calls stubbed out, so only their queries are left"""
+    monkeypatch.setattr("api.v1.auth.routes.add_jti_to_blocklist", AsyncMock())
+    monkeypatch.setattr("api.v1.auth.routes.send_bulk_email.delay", MagicMock(return_value=SimpleNamespace(id="job-1")))
+    monkeypatch.setattr("api.v1.auth.routes.get_bulk_email_progress", lambda job_id: {"job_id": job_id, "state": "PENDING"})
+    return api_client
+
+
+async def make_admin(session_factory, user_uid: str) -> None:
+    async with session_factory() as session:
+        await session.exec(update(User).where(User.uid == uuid.UUID(user_uid)).values(role="admin"))
+        await session.commit()
+
+
+@pytest.mark.parametrize("method, path, body, budget", ROUTE_QUERY_BUDGETS)
+def test_route_stays_within_query_budget(budget_client, assert_query_budget, method, path, body, budget):
+    values = {**vars(budget_client), "verify_token": create_url_safe_token({"email": budget_client.email})}
+    if body is not None:
+        body = {key: value.format(**values) if isinstance(value, str) else value for key, value in body.items()}
+
+    response = budget_client.client.request(method, path.format(**values), json=body)
+
+    assert response.status_code < 400, response.text
+    assert_query_budget(response, budget)
+
+
+@pytest.mark.parametrize("method, path, budget", ADMIN_ROUTE_QUERY_BUDGETS)
+def test_admin_route_stays_within_query_budget(api_client, assert_query_budget, method, path, budget):
+    asyncio.run(make_admin(api_client.session_factory, api_client.user_uid))
+
+    response = api_client.client.request(method, path)
+
+    assert response.status_code < 400, response.text
+    assert_query_budget(response, budget)
+
+
+def test_refresh_token_route_runs_no_queries(api_client, assert_query_budget):
+    refresh_token = create_access_token(user_data={"email": api_client.email, "user_uid": api_client.user_uid, "role": "user"},
+                                        refresh=True)
+
+    response = api_client.client.get("/api/v1/auth/refresh_token", headers={"Authorization": f"Bearer {refresh_token}"})
+
+    assert response.status_code < 400, response.text
+    assert_query_budget(response, 0)
+
+
+def test_bulk_import_stays_within_query_budget(api_client, assert_query_budget):
+    asyncio.run(make_admin(api_client.session_factory, api_client.user_uid))
+    line = ('{"title": "Imported", "author": "Author", "publisher": "Publisher", "published_date": "2024-12-10", '
+            '"page_count": 120, "language": "English"}')
+
+    response = api_client.client.post("/api/v1/books/import", content="\n".join([line] * 3),
+                                      headers={"content-type": "application/x-ndjson"})
+
+    assert response.status_code < 400, response.text
+    assert_query_budget(response, 2)  # Principal, then one insert for the whole batch
+
+
+def test_export_stays_within_query_budget(api_client, sqlite_engine, monkeypatch):
+    # The Server-Timing header goes out before the streamed body is read, so count every statement instead
+    monkeypatch.setattr("config.Config.BOOK_EXPORT_CHUNK_SIZE", 2)
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(sqlite_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        response = api_client.client.get("/api/v1/books/export")
+    finally:
+        event.remove(sqlite_engine.sync_engine, "before_cursor_execute", listener)
+
+    assert response.status_code < 400, response.text
+    assert len(statements) <= 2, statements  # Principal, then one chunk holding the seeded book
@@ -0,0 +1,73 @@
+import uuid
+
+
+def test_book_reviews_are_paginated_newest_first(api_client):
+    client = api_client.client
+    for rating in (1, 3):
+        client.post(f"/api/v1/reviews/book/{api_client.book_uid}", json={"rating": rating, "review_text": "Another review"})
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2} if cursor is None else {"limit": 2, "cursor": cursor}
+        page = client.get(f"/api/v1/reviews/book/{api_client.book_uid}", params=params).json()
+        seen.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(seen) == 5
+    assert len({review["uid"] for review in seen}) == 5
+    assert seen[0]["rating"] == 3  # The last review posted
+    assert [review["created_at"] for review in seen] == sorted((review["created_at"] for review in seen), reverse=True)
+
+
+def test_book_reviews_sorted_by_rating(api_client):
+    client = api_client.client
+    client.post(f"/api/v1/reviews/book/{api_client.book_uid}", json={"rating": 1, "review_text": "Poor"})
+
+    first_page = client.get(f"/api/v1/reviews/book/{api_client.book_uid}", params={"sort": "rating", "limit": 3}).json()
+    second_page = client.get(f"/api/v1/reviews/book/{api_client.book_uid}",
+                             params={"sort": "rating", "limit": 3, "cursor": first_page["next_cursor"]}).json()
+
+    assert [review["rating"] for review in first_page["items"] + second_page["items"]] == [4, 4, 4, 1]
+    assert second_page["next_cursor"] is None
+
+
+def test_book_reviews_of_missing_book(api_client):
+    response = api_client.client.get(f"/api/v1/reviews/book/{uuid.uuid4()}")
+
+    assert response.status_code == 404
+    assert response.json()["status_code"] == 404
+
+
+def test_book_detail_with_newest_reviews_only(api_client):
+    client = api_client.client
+    client.post(f"/api/v1/reviews/book/{api_client.book_uid}", json={"rating": 0, "review_text": "Newest"})
+
+    book = client.get(f"/api/v1/books/{api_client.book_uid}", params={"review_limit": 1}).json()
+
+    assert [review["review_text"] for review in book["reviews"]] == ["Newest"]
+    assert len(client.get(f"/api/v1/books/{api_client.book_uid}").json()["reviews"]) == 4
+
+
+def test_review_on_missing_book_is_not_inserted(api_client):
+    client = api_client.client
+    response = client.post(f"/api/v1/reviews/book/{uuid.uuid4()}", json={"rating": 2, "review_text": "Lost"})
+
+    assert response.status_code == 404
+    assert len(client.get(f"/api/v1/reviews/book/{api_client.book_uid}").json()["items"]) == 3
+
+
+def test_review_takes_same_queries_for_prolific_user(api_client, assert_query_budget):
+    client = api_client.client
+    for _ in range(10):
+        client.post("/api/v1/books/", json={"title": "More", "author": "Author", "publisher": "Publisher",
+                                            "published_date": "2024-12-10", "page_count": 100, "language": "English"})
+        client.post(f"/api/v1/reviews/book/{api_client.book_uid}", json={"rating": 3, "review_text": "Again"})
+
+    response = client.post(f"/api/v1/reviews/book/{api_client.book_uid}", json={"rating": 3, "review_text": "Once more"})
+
+    assert response.status_code == 201
+    assert response.json()["user_uid"] == api_client.user_uid
+    assert_query_budget(response, 2)  # Principal already cached: stats UPDATE and review INSERT